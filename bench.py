@@ -0,0 +1,143 @@
+from doublecram import library
+from doublecram.solve import solve_square, solve_mn, SUMS
+from doublecram.doublecram import validMoves, decompose, makeMove
+from doublecram.mex import mex, nim_addition
+from grid import Shape
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+parser = argparse.ArgumentParser( description = "Time the solver's hot paths." )
+# Boards that fit in the library's box are only a lookup, so the
+# defaults start above it.
+parser.add_argument( "--sizes", type = int, nargs = "*",
+                     default = [ library.BOX + 1, library.BOX + 2, library.BOX + 3 ],
+                     help = "square boards to solve" )
+parser.add_argument( "--strips", type = int, nargs = "*", default = [8, 12, 16],
+                     help = "4xN boards to solve" )
+parser.add_argument( "--repeat", type = int, default = 3,
+                     help = "runs of each benchmark; the fastest is kept" )
+parser.add_argument( "--loops", type = int, default = 20,
+                     help = "passes over the sample in each run of the "
+                            "smaller benchmarks" )
+parser.add_argument( "--output", help = "write the results to this JSON file" )
+parser.add_argument( "--baseline", default = "results/bench-baseline.json",
+                     help = "JSON results to compare against" )
+parser.add_argument( "--save-baseline", action = "store_true",
+                     help = "store these results as the new baseline" )
+parser.add_argument( "--threshold", type = float, default = 0.10,
+                     help = "relative change reported as faster or slower" )
+args = parser.parse_args()
+
+def timed( fn, repeat ):
+    best = None
+    for i in range( repeat ):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+# A fixed sample of the regions the solver really sees
+_, _, sample_values = solve_square( 6 )
+_, _, strip_values = solve_mn( 4, 10 )
+shapes = [ Shape.fromKey( k ) for k in sorted( sample_values ) + sorted( strip_values ) ]
+coords = [ s.coords for s in shapes ]
+moves = [ (s, m) for s in shapes for m in validMoves( s ) ]
+successors = [ [ (i * 7 + j) % 5 for j in range( i % 9 ) ] for i in range( 1000 ) ]
+
+def run_canonical():
+    for i in range( args.loops ):
+        for s in shapes:
+            s.canonical()
+
+def run_validMoves():
+    for i in range( args.loops ):
+        for c in coords:
+            validMoves( c )
+
+def run_decompose():
+    for i in range( args.loops ):
+        for c in coords:
+            decompose( c )
+
+def run_makeMove():
+    for i in range( args.loops ):
+        for s, m in moves:
+            makeMove( s, m )
+
+def run_mex():
+    for i in range( args.loops ):
+        for v in successors:
+            mex( v )
+            if len( v ) > 0:
+                nim_addition( *v )
+
+benchmarks = [
+    ( "canonical", run_canonical ),
+    ( "validMoves", run_validMoves ),
+    ( "decompose", run_decompose ),
+    ( "makeMove", run_makeMove ),
+    ( "mex", run_mex ),
+]
+
+# Each solve starts from an empty sum memo, so that the runs of one
+# benchmark, and later benchmarks, do not reuse earlier partitions.
+def fresh( solve, *size ):
+    SUMS.entries.clear()
+    solve( *size )
+
+for n in args.sizes:
+    benchmarks.append( ( "solve_square({})".format( n ),
+                         lambda n = n : fresh( solve_square, n ) ) )
+for n in args.strips:
+    benchmarks.append( ( "solve_mn(4,{})".format( n ),
+                         lambda n = n : fresh( solve_mn, 4, n ) ) )
+
+results = {}
+for name, fn in benchmarks:
+    results[name] = timed( fn, args.repeat )
+    print( "{:20s} {:10.4f}s".format( name, results[name] ) )
+
+report = {
+    "python" : platform.python_version(),
+    "machine" : platform.machine(),
+    "time" : time.strftime( "%Y-%m-%dT%H:%M:%S" ),
+    "seconds" : results
+}
+
+if args.output is not None:
+    with open( args.output, "w" ) as f:
+        json.dump( report, f, indent = 2 )
+
+status = 0
+if not args.save_baseline and os.path.exists( args.baseline ):
+    with open( args.baseline ) as f:
+        baseline = json.load( f )["seconds"]
+    print()
+    print( "compared with", args.baseline )
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        ratio = seconds / baseline[name]
+        if ratio > 1 + args.threshold:
+            verdict = "slower"
+            status = 1
+        elif ratio < 1 - args.threshold:
+            verdict = "faster"
+        else:
+            verdict = ""
+        print( "{:20s} {:10.4f}s {:6.2f}x {}".format(
+            name, baseline[name], ratio, verdict ) )
+
+if args.save_baseline:
+    with open( args.baseline, "w" ) as f:
+        json.dump( report, f, indent = 2 )
+    print( "saved baseline to", args.baseline )
+
+sys.exit( status )
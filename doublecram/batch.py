@@ -0,0 +1,83 @@
+"""Valid moves and coverable squares for many shapes at once, with NumPy.
+
+A batch is a boolean array of shape (N, height, width) where [i, y, x]
+is set if square (x,y) of the i-th shape is free.  The results match
+validMoves and trimShape on each shape in turn.
+"""
+import numpy as np
+
+from grid import Shape
+from doublecram.doublecram import asShape
+
+def _rows( s ):
+    """The free squares of a Shape as a 2-d array from its origin."""
+    height = ( s.bits.bit_length() + s.stride - 1 ) // s.stride
+    data = np.frombuffer( s.bits.to_bytes( ( height * s.stride + 7 ) // 8,
+                                           "little" ), dtype = np.uint8 )
+    bits = np.unpackbits( data, bitorder = "little" )[:height * s.stride]
+    return bits.reshape( height, s.stride ).astype( bool )
+
+def occupancy( shapes, width = None, height = None ):
+    """Stack Shapes or collections of squares into one batch, large
+    enough for all of them unless width and height are given."""
+    shapes = [ asShape( s ) for s in shapes ]
+    if any( s.x0 < 0 or s.y0 < 0 for s in shapes ):
+        raise ValueError( "squares must have non-negative coordinates" )
+    if width is None:
+        width = max( [ s.width() for s in shapes ], default = 0 )
+    if height is None:
+        height = max( [ s.height() for s in shapes ], default = 0 )
+    occ = np.zeros( ( len( shapes ), height, width ), dtype = bool )
+    for i, s in enumerate( shapes ):
+        rows = _rows( s )
+        h = min( rows.shape[0], height - s.y0 )
+        w = min( rows.shape[1], width - s.x0 )
+        if h > 0 and w > 0:
+            occ[i, s.y0:s.y0 + h, s.x0:s.x0 + w] = rows[:h, :w]
+    return occ
+
+def moveMasks( occ ):
+    """Mark the corner of every valid move in each shape of the batch."""
+    moves = np.zeros_like( occ )
+    moves[:, :-1, :-1] = occ[:, :-1, :-1] & occ[:, :-1, 1:] & \
+                         occ[:, 1:, :-1] & occ[:, 1:, 1:]
+    return moves
+
+def coverMasks( occ, moves = None ):
+    """Mark the squares of each shape that some valid move could cover."""
+    if moves is None:
+        moves = moveMasks( occ )
+    cover = moves.copy()
+    cover[:, :, 1:] |= moves[:, :, :-1]
+    cover[:, 1:, :] |= moves[:, :-1, :]
+    cover[:, 1:, 1:] |= moves[:, :-1, :-1]
+    return cover
+
+def _coords( masks ):
+    """List the set squares of each mask, sorted by x and then y."""
+    found = np.argwhere( masks.transpose( 0, 2, 1 ) )
+    bounds = np.searchsorted( found[:, 0], np.arange( len( masks ) + 1 ) )
+    return [ [ (int( x ), int( y ) ) for (_, x, y) in found[a:b] ]
+             for a, b in zip( bounds[:-1], bounds[1:] ) ]
+
+def validMoves( occ ):
+    """validMoves for each shape in the batch."""
+    return _coords( moveMasks( occ ) )
+
+def trimShapes( occ ):
+    """trimShape for each shape in the batch."""
+    return [ Shape( c ) for c in _coords( coverMasks( occ ) ) ]
+
+def test():
+    import doublecram.doublecram as single
+    from grid.shape import enumerate as enumerateShapes
+
+    shapes = list( enumerateShapes( 4 ) )
+    occ = occupancy( shapes )
+    for s, moves, trimmed in zip( shapes, validMoves( occ ), trimShapes( occ ) ):
+        assert moves == single.validMoves( s ), s.coords
+        assert trimmed.coords == single.trimShape( s ).coords, s.coords
+    print( "checked", len( shapes ), "shapes" )
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+import time
+
+from grid.bitboard import extent
+from doublecram.doublecram import distinctMoves, regionKey, regionMoves, splitRegions
+
+def iterExpand( shape, profile = None, moves = None, reduce = None ):
+    """Generate (move, keys) for every valid move on shape, up to the
+    shape's own symmetries, where keys are the canonical keys of the
+    regions the move leaves, reduced as regionKey does if reduce is
+    true.  profile is an optional Instruments to charge the time to, and
+    moves is distinctMoves( shape ) if the caller already has it."""
+    stride = shape.stride
+    if moves is None and profile is None:
+        moves = distinctMoves( shape )
+    if profile is None:
+        region = regionMoves( shape )
+        for move in moves:
+            yield move, tuple( regionKey( r, stride, reduce )
+                               for r in splitRegions( shape, move, region ) )
+        return
+
+    # Each phase is done for every move at once, so that it is timed once
+    # per position rather than once per move.
+    start = time.perf_counter()
+    region = regionMoves( shape )
+    if moves is None:
+        moves = distinctMoves( shape )
+    profile.add( "moves", start )
+    start = time.perf_counter()
+    splits = [ splitRegions( shape, move, region ) for move in moves ]
+    profile.add( "split", start )
+    start = time.perf_counter()
+    keys = [ tuple( regionKey( r, stride, reduce ) for r in regions )
+             for regions in splits ]
+    profile.add( "canonical", start )
+    yield from zip( moves, keys )
+
+def expand( shape, profile = None, reduce = None ):
+    return list( iterExpand( shape, profile, reduce = reduce ) )
+
+class MoveCache(object):
+    """Least-recently-used cache of expand() results, keyed by Shape.key().
+
+    Shapes with the same key may sit at different places, so moves are
+    stored relative to the top left corner of the shape's squares and
+    returned in the coordinates of the shape asked about.
+
+    The cache holds at most maxEntries shapes and maxChildren child keys
+    in total; None means no limit.  reduce is passed on to expand(), so
+    a cache holds either reduced or unreduced keys, never both."""
+
+    def __init__( self, maxEntries = 100000, maxChildren = None, reduce = None ):
+        self.maxEntries = maxEntries
+        self.maxChildren = maxChildren
+        self.reduce = reduce
+        self.entries = OrderedDict()
+        self.children = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _size( self, entry ):
+        return sum( len( keys ) for (move, keys) in entry )
+
+    def moves( self, shape, profile = None ):
+        key = shape.key()
+        minX, minY, _, _ = extent( shape.bits, shape.stride )
+        ox = shape.x0 + minX
+        oy = shape.y0 + minY
+        entry = self.entries.get( key )
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end( key )
+            if ox == 0 and oy == 0:
+                return entry
+            return [ ( (x + ox, y + oy), keys ) for (x,y), keys in entry ]
+
+        self.misses += 1
+        result = expand( shape, profile, self.reduce )
+        if ox == 0 and oy == 0:
+            entry = result
+        else:
+            entry = [ ( (x - ox, y - oy), keys ) for (x,y), keys in result ]
+        self.entries[key] = entry
+        self.children += self._size( entry )
+        while len( self.entries ) > 1 and \
+              ( ( self.maxEntries is not None and
+                  len( self.entries ) > self.maxEntries ) or
+                ( self.maxChildren is not None and
+                  self.children > self.maxChildren ) ):
+            _, old = self.entries.popitem( last = False )
+            self.children -= self._size( old )
+            self.evictions += 1
+        return result
+
+    def __len__( self ):
+        return len( self.entries )
+
+    def stats( self ):
+        return "{} shapes, {} hits, {} misses, {} evictions".format(
+            len( self.entries ), self.hits, self.misses, self.evictions )
+
+def children( shape, cache = None, profile = None, reduce = None ):
+    """expand( shape ), through cache if there is one, in which case
+    the cache's own reduce applies."""
+    if cache is None:
+        return expand( shape, profile, reduce )
+    return cache.moves( shape, profile )
@@ -0,0 +1,79 @@
+"""Periodic snapshots of a solve that can be resumed after an interruption.
+
+A checkpoint is a pickle of the values table together with the stack of
+the IterativeSolver in progress, if any, and an info dict the caller
+uses to say what was being solved.  A ValueStore table is flushed
+instead of copied, since its file already survives the process.
+
+Each snapshot is written to a temporary file which then replaces the
+old one, so an interruption while writing leaves the previous
+checkpoint intact.  Writing the table costs time in proportion to its
+size, so the interval is stretched whenever the last write took more
+than maxOverhead of the time since the one before.
+"""
+import os
+import pickle
+import time
+
+from doublecram.store import ValueStore
+
+VERSION = 1
+
+class Checkpointer(object):
+    """Write checkpoints of values, and of the solver it is called with,
+    to path at most every interval seconds.  IterativeSolver calls it
+    every few thousand steps."""
+
+    def __init__( self, path, values, interval = 600.0, maxOverhead = 0.05,
+                  info = None ):
+        self.path = path
+        self.values = values
+        self.interval = interval
+        self.maxOverhead = maxOverhead
+        self.info = {} if info is None else info
+        self.wait = interval
+        self.last = time.monotonic()
+        self.writes = 0
+        self.seconds = 0.0
+
+    def __call__( self, solver ):
+        if time.monotonic() - self.last >= self.wait:
+            self.write( solver )
+
+    def write( self, solver = None ):
+        """Write a checkpoint now, of solver's stack if it is given."""
+        start = time.monotonic()
+        if isinstance( self.values, ValueStore ):
+            self.values.flush()
+            values = None
+        else:
+            values = self.values
+        state = { "version" : VERSION,
+                  "info" : self.info,
+                  "values" : values,
+                  "solver" : None if solver is None else solver.state() }
+        temp = self.path + ".tmp"
+        with open( temp, "wb" ) as f:
+            pickle.dump( state, f, pickle.HIGHEST_PROTOCOL )
+            f.flush()
+            os.fsync( f.fileno() )
+        os.replace( temp, self.path )
+
+        now = time.monotonic()
+        took = now - start
+        self.writes += 1
+        self.seconds += took
+        self.wait = max( self.interval, took / self.maxOverhead )
+        self.last = now
+
+    def stats( self ):
+        return "{} checkpoints in {:.1f}s".format( self.writes, self.seconds )
+
+def load( path ):
+    """Read a checkpoint, returning a dict with its info, values (None
+    for a ValueStore) and solver state."""
+    with open( path, "rb" ) as f:
+        state = pickle.load( f )
+    if state.get( "version" ) != VERSION:
+        raise ValueError( "{} is not a version {} checkpoint".format( path, VERSION ) )
+    return state
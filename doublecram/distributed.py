@@ -0,0 +1,360 @@
+"""Solve a board with a coordinator and worker processes that share a
+queue of subproblems in an SQLite file.
+
+The coordinator expands the first few levels of the game tree, puts
+every canonical region it reaches there that is not already known on
+the queue, and once workers have solved them all values the levels it
+expanded from the smallest up, as solve_parallel does.  Each worker
+repeatedly claims a region, solves it against its own table and writes
+back the value.
+
+A claim is a lease that the worker renews from a background thread
+while it solves.  If the worker dies, the lease runs out and another
+worker claims the region again, so a killed worker costs only the time
+it had spent on its current region.  Tasks are filed under the board
+they belong to, so several boards may share a queue: a coordinator
+waits only for its own, and the workers it starts claim only its own.
+Finished regions stay in the file, so a coordinator started again on
+the same queue only waits for the rest.
+
+    python -m doublecram.distributed coordinator QUEUE SIZE [--workers N]
+    python -m doublecram.distributed worker QUEUE
+
+Workers may run on any machine that can open the queue file, or be
+started by the coordinator on its own machine with --workers.
+"""
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from grid import Shape
+from grid.canonical import cells
+from doublecram.cache import expand
+from doublecram.mex import mex, nim_addition
+from doublecram.solve import SMALL, IterativeSolver
+from doublecram.store import encodeKey, decodeKey
+from doublecram.sums import cancel, closedForm
+
+PENDING = 0
+LEASED = 1
+DONE = 2
+
+class WorkQueue(object):
+    """Regions to solve, keyed by the canonical keys of the board they
+    belong to and of the region, in an SQLite file.
+
+    A region is pending, leased to a worker until a deadline, or done
+    with its value.  Claims take the largest pending region first, or
+    one whose lease has run out.  The methods that take a root limit
+    themselves to that board's regions if it is given."""
+
+    def __init__( self, path, lease = 30.0, timeout = 60.0 ):
+        self.path = path
+        self.lease = lease
+        self.conn = sqlite3.connect( path, timeout = timeout,
+                                     isolation_level = None )
+        self.conn.execute( "PRAGMA journal_mode=WAL" )
+        self.conn.execute( "CREATE TABLE IF NOT EXISTS tasks "
+                           "(root BLOB NOT NULL, shape BLOB NOT NULL, "
+                           "cells INTEGER NOT NULL, "
+                           "state INTEGER NOT NULL, worker TEXT, deadline REAL, "
+                           "attempts INTEGER NOT NULL DEFAULT 0, value INTEGER, "
+                           "PRIMARY KEY (root, shape)) WITHOUT ROWID" )
+
+    def _where( self, root ):
+        """SQL condition and parameters limiting a query to root."""
+        if root is None:
+            return "", ()
+        return " AND root = ?", ( encodeKey( root ), )
+
+    def add( self, root, keys ):
+        """Queue the regions with keys for the board with key root,
+        unless they are there already."""
+        self.conn.execute( "BEGIN IMMEDIATE" )
+        self.conn.executemany( "INSERT OR IGNORE INTO tasks "
+                               "(root, shape, cells, state) VALUES (?, ?, ?, ?)",
+                               [ ( encodeKey( root ), encodeKey( k ), cells( k ),
+                                   PENDING ) for k in keys ] )
+        self.conn.execute( "COMMIT" )
+
+    def claim( self, worker, root = None ):
+        """Lease a region to worker and return its key, or None if there
+        is nothing to claim right now."""
+        now = time.time()
+        where, params = self._where( root )
+        self.conn.execute( "BEGIN IMMEDIATE" )
+        try:
+            row = self.conn.execute(
+                "SELECT root, shape FROM tasks WHERE ( state = ? OR "
+                "( state = ? AND deadline < ? ) )" + where +
+                " ORDER BY cells DESC LIMIT 1",
+                ( PENDING, LEASED, now ) + params ).fetchone()
+            if row is not None:
+                self.conn.execute(
+                    "UPDATE tasks SET state = ?, worker = ?, deadline = ?, "
+                    "attempts = attempts + 1 WHERE root = ? AND shape = ?",
+                    ( LEASED, worker, now + self.lease, row[0], row[1] ) )
+        finally:
+            self.conn.execute( "COMMIT" )
+        return None if row is None else decodeKey( row[1] )
+
+    def renew( self, key, worker ):
+        """Extend worker's lease on key.  Returns False if the lease has
+        passed to another worker or the region is done."""
+        cursor = self.conn.execute(
+            "UPDATE tasks SET deadline = ? WHERE shape = ? AND worker = ? "
+            "AND state = ?", ( time.time() + self.lease, encodeKey( key ),
+                               worker, LEASED ) )
+        return cursor.rowcount > 0
+
+    def finish( self, key, value ):
+        """Record the value of key, for every board that needs it.  Every
+        worker finds the same value, so it does not matter whose lease it
+        was."""
+        self.conn.execute( "UPDATE tasks SET state = ?, value = ?, deadline = NULL "
+                           "WHERE shape = ? AND state != ?",
+                           ( DONE, value, encodeKey( key ), DONE ) )
+
+    def counts( self, root = None ):
+        """Number of (pending, leased, done) regions; leases that have run
+        out count as pending."""
+        now = time.time()
+        where, params = self._where( root )
+        pending, leased, done = 0, 0, 0
+        for state, deadline, n in self.conn.execute(
+                "SELECT state, deadline < ?, COUNT(*) FROM tasks WHERE 1" +
+                where + " GROUP BY state, deadline < ?",
+                ( now, ) + params + ( now, ) ):
+            if state == DONE:
+                done += n
+            elif state == LEASED and not deadline:
+                leased += n
+            else:
+                pending += n
+        return pending, leased, done
+
+    def results( self, root = None ):
+        """Dict of the value of every region that is done."""
+        where, params = self._where( root )
+        return { decodeKey( shape ) : value for shape, value in
+                 self.conn.execute( "SELECT shape, value FROM tasks WHERE state = ?" +
+                                    where, ( DONE, ) + params ) }
+
+    def close( self ):
+        self.conn.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc ):
+        self.close()
+
+class _Heartbeat(threading.Thread):
+    """Renew a lease every interval seconds until stopped, on a
+    connection of its own."""
+
+    def __init__( self, path, key, worker, lease, interval ):
+        super().__init__( daemon = True )
+        self.path = path
+        self.key = key
+        self.worker = worker
+        self.lease = lease
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run( self ):
+        with WorkQueue( self.path, self.lease ) as queue:
+            while not self.stopped.wait( self.interval ):
+                if not queue.renew( self.key, self.worker ):
+                    break
+
+    def stop( self ):
+        self.stopped.set()
+        self.join()
+
+def workerName():
+    return "{}:{}".format( socket.gethostname(), os.getpid() )
+
+def work( path, values = None, lease = 30.0, poll = 1.0, report = None,
+          root = None ):
+    """Claim and solve regions from the queue at path until every region
+    is done, or every region of the board with key root if it is given,
+    keeping values in the table values, a dict by default.  Returns the
+    number of regions this worker solved."""
+    if values is None:
+        values = {}
+    name = workerName()
+    solved = 0
+    with WorkQueue( path, lease ) as queue:
+        while True:
+            key = queue.claim( name, root )
+            if key is None:
+                pending, leased, done = queue.counts( root )
+                if pending + leased == 0:
+                    return solved
+                time.sleep( poll )
+                continue
+            heartbeat = _Heartbeat( path, key, name, lease, lease / 3 )
+            heartbeat.start()
+            try:
+                value = IterativeSolver( Shape.fromKey( key ), values,
+                                         report = report ).run()
+            finally:
+                heartbeat.stop()
+            queue.finish( key, value )
+            solved += 1
+
+def _known( key, shape_values ):
+    value = shape_values.get( key )
+    if value is None:
+        value = SMALL.get( key )
+    if value is None:
+        value = closedForm( key )
+    return value
+
+def expandLevels( root, levels, shape_values ):
+    """Expand the tree below root for the given number of levels.
+    Returns the partitions of each position expanded, the values already
+    known of the regions reached, and the regions left to solve."""
+    children = {}
+    known = {}
+    frontier = []
+    level = [ root ]
+    seen = set( level )
+    for depth in range( levels + 1 ):
+        nextLevel = []
+        for key in level:
+            if depth == levels:
+                frontier.append( key )
+                continue
+            partitions = set( cancel( keys )
+                              for move, keys in expand( Shape.fromKey( key ) ) )
+            children[key] = list( partitions )
+            for partition in partitions:
+                for k in partition:
+                    if k in seen:
+                        continue
+                    seen.add( k )
+                    value = _known( k, shape_values )
+                    if value is None:
+                        nextLevel.append( k )
+                    else:
+                        known[k] = value
+        level = nextLevel
+    return children, known, frontier
+
+def coordinate( shape, path, levels = 2, workers = 0, shape_values = None,
+                lease = 30.0, poll = 1.0, progress = None ):
+    """Solve shape by queueing the regions levels moves below it in the
+    file at path and waiting for workers to solve them.  workers is the
+    number of worker processes to start, and restart if they die, on
+    this machine; others may be started elsewhere.  progress is a
+    function called with (pending, leased, done) every poll seconds.
+    Returns the value of shape, which is also stored in shape_values
+    with those of the positions expanded."""
+    if shape_values is None:
+        shape_values = {}
+    root = shape.key()
+    value = _known( root, shape_values )
+    if value is not None:
+        return value
+
+    children, known, frontier = expandLevels( root, levels, shape_values )
+    procs = []
+    with WorkQueue( path, lease ) as queue:
+        queue.add( root, frontier )
+        try:
+            while True:
+                pending, leased, done = queue.counts( root )
+                if progress is not None:
+                    progress( pending, leased, done )
+                if pending + leased == 0:
+                    break
+                procs = [ p for p in procs if p.is_alive() ]
+                while len( procs ) < workers:
+                    p = multiprocessing.Process( target = work,
+                                                 args = ( path, None, lease, poll,
+                                                          None, root ) )
+                    p.start()
+                    procs.append( p )
+                time.sleep( poll )
+            results = queue.results( root )
+        finally:
+            for p in procs:
+                p.join()
+
+    for key in frontier:
+        known[key] = shape_values[key] = results[key]
+    for key in sorted( children, key = cells ):
+        successorValues = set()
+        for partition in children.pop( key ):
+            if len( partition ) == 0:
+                successorValues.add( 0 )
+            else:
+                successorValues.add( nim_addition( *[ known[k] for k in partition ] ) )
+        known[key] = shape_values[key] = mex( successorValues )
+    return known[root]
+
+def test():
+    import tempfile
+    from doublecram.solve import solve_mn
+
+    start, expected, _ = solve_mn( 5, 6 )
+    other, _, _ = solve_mn( 6, 7 )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join( tmp, "queue.db" )
+        children, known, frontier = expandLevels( start.key(), 1, {} )
+        with WorkQueue( path, lease = 0.5 ) as queue:
+            # Another board's work, which the coordinator should leave be.
+            queue.add( other.key(), expandLevels( other.key(), 1, {} )[2] )
+            # A worker that claims a region and dies without finishing it.
+            queue.add( start.key(), frontier )
+            lost = queue.claim( "killed", start.key() )
+        value = coordinate( start, path, levels = 1, workers = 2,
+                            lease = 0.5, poll = 0.1 )
+        with WorkQueue( path ) as queue:
+            attempts = queue.conn.execute(
+                "SELECT attempts FROM tasks WHERE root = ? AND shape = ?",
+                ( encodeKey( start.key() ), encodeKey( lost ) ) ).fetchone()[0]
+            untouched = queue.counts( other.key() )[1:] == ( 0, 0 )
+    assert value == expected, ( value, expected )
+    assert attempts >= 2
+    assert untouched
+    print( "5 x 6 has nim-value", value, "with", len( frontier ), "regions queued" )
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser( description = "Solve doublecram with a queue of subproblems." )
+    parser.add_argument( "role", choices = [ "coordinator", "worker", "test" ] )
+    parser.add_argument( "queue", nargs = "?", help = "SQLite file of the queue" )
+    parser.add_argument( "size", type = int, nargs = "?", default = 7 )
+    parser.add_argument( "--levels", type = int, default = 2,
+                         help = "levels of the tree the coordinator expands" )
+    parser.add_argument( "--workers", type = int, default = 0,
+                         help = "worker processes the coordinator starts itself" )
+    parser.add_argument( "--lease", type = float, default = 30.0, metavar = "SECONDS",
+                         help = "how long a region stays claimed without a heartbeat" )
+    parser.add_argument( "--poll", type = float, default = 1.0, metavar = "SECONDS" )
+    args = parser.parse_args()
+
+    if args.role == "test":
+        test()
+    elif args.queue is None:
+        parser.error( "a queue file is needed" )
+    elif args.role == "worker":
+        print( "solved", work( args.queue, lease = args.lease, poll = args.poll ),
+               "regions" )
+    else:
+        size = args.size
+        square = Shape( [(x,y) for x in range(size) for y in range(size)] ).canonical()
+        def progress( pending, leased, done ):
+            print( "{} pending, {} leased, {} done".format( pending, leased, done ),
+                   flush = True )
+        value = coordinate( square, args.queue, args.levels, args.workers,
+                            lease = args.lease, poll = args.poll,
+                            progress = progress )
+        print( "square has nim-value", value )
@@ -1,22 +1,124 @@
-from grid import Shape
+from grid import Shape, native
+from grid.bitboard import extent, unpack
+from grid.canonical import canonicalKey
 from grid.shape import plot_text
 
+if native.lib is not None:
+    _groups = native.ffi.new( "uint64_t[32]" )
+
+# Moves are kept as bitboards in the same layout as the shape they are
+# played on; a move is the bit of the corner (x,y) of the 2x2 square
+# covering (x,y) through (x+1,y+1).
+
+def moveMask( bits, stride ):
+    """Bitboard of every valid move on the free squares in bits."""
+    return bits & ( bits >> 1 ) & ( bits >> stride ) & ( bits >> (stride+1) )
+
+def coverMask( moves, stride ):
+    """Bitboard of the squares covered by a bitboard of moves."""
+    return moves | ( moves << 1 ) | ( moves << stride ) | ( moves << (stride+1) )
+
+def touchMask( moves, stride ):
+    """Bitboard of every position whose move would overlap one of moves."""
+    rows = moves | ( moves << 1 ) | ( moves >> 1 )
+    return rows | ( rows << stride ) | ( rows >> stride )
+
+# Whether makeMove replaces regions by simpler ones with the same game;
+# see reducedKey.
+REDUCE = True
+
+_stripKeys = {}
+
+def stripKey( n ):
+    """Canonical key of the 2 x n strip."""
+    key = _stripKeys.get( n )
+    if key is None:
+        bits = 0
+        for y in range( n ):
+            bits |= 3 << ( y * 3 )
+        key = _stripKeys[n] = canonicalKey( bits, 3 )
+    return key
+
+def reducedKey( region, stride ):
+    """Return the key of a simpler region with the same game as region,
+    or None.
+
+    Playing a move takes away exactly the moves that overlap it, so the
+    game only depends on which moves overlap which.  If every move
+    overlaps every other, any first move ends the game, as on a 2x2
+    square.  If the moves form a chain, each overlapping just the one
+    before and the one after, the game is that of a 2 x n strip."""
+    moves = moveMask( region, stride )
+    count = bin( moves ).count( "1" )
+    if count == 1:
+        return None
+    complete = True
+    chain = True
+    ends = 0
+    rest = moves
+    while rest:
+        move = rest & -rest
+        rest ^= move
+        degree = bin( touchMask( move, stride ) & moves ).count( "1" ) - 1
+        if degree != count - 1:
+            complete = False
+        if degree > 2:
+            chain = False
+        elif degree == 1:
+            ends += 1
+        if not complete and not chain:
+            return None
+    if complete:
+        return stripKey( 2 )
+    # A connected graph with every degree at most two and two ends is a
+    # path rather than a cycle.
+    if ends == 2:
+        return stripKey( count + 1 )
+    return None
+
+def asShape( coords ):
+    if isinstance( coords, Shape ):
+        return coords
+    return Shape( coords )
+
 def validMoves( coords ):
-    free = set( coords )
-    moves = []
-    for (x,y) in coords:
-        if (x+1,y) in free and (x,y+1) in free and (x+1,y+1) in free:
-            moves.append( (x,y) )
-    return moves
+    """List the corner of every valid move, given a Shape or a collection
+    of free squares."""
+    shape = asShape( coords )
+    return sorted( unpack( moveMask( shape.bits, shape.stride ),
+                           shape.stride, shape.x0, shape.y0 ) )
+
+def distinctMoves( shape ):
+    """validMoves( shape ), keeping only the first of any moves that one of
+    the shape's own symmetries carries onto each other."""
+    moves = validMoves( shape )
+    symmetries = shape.symmetries()
+    if len( symmetries ) == 1:
+        return moves
+
+    minX, minY, _, _ = extent( shape.bits, shape.stride )
+    ox = shape.x0 + minX
+    oy = shape.y0 + minY
+    seen = set()
+    distinct = []
+    for (x,y) in moves:
+        if (x,y) in seen:
+            continue
+        distinct.append( (x,y) )
+        for f in symmetries:
+            # The move covering (x,y) to (x+1,y+1) is carried to the one
+            # whose corner is the smaller of the images of those squares.
+            ax, ay = f( (x - ox, y - oy) )
+            bx, by = f( (x + 1 - ox, y + 1 - oy) )
+            seen.add( ( min( ax, bx ) + ox, min( ay, by ) + oy ) )
+    return distinct
 
 def trimShape( shape ):
-    covered = set()
-    for (x,y) in validMoves( shape ):
-        covered.add( (x,y) )
-        covered.add( (x+1,y) )
-        covered.add( (x,y+1) )
-        covered.add( (x+1,y+1) )
-    return Shape( covered )
+    """Return the squares of shape that some valid move could cover."""
+    shape = asShape( shape )
+    moves = moveMask( shape.bits, shape.stride )
+    return Shape.fromBits( coverMask( moves, shape.stride ),
+                           shape.stride, shape.x0, shape.y0 )
 
 def canCover( free, x, y ):
     """Can some valid move cover square x,y?"""
@@ -61,52 +163,29 @@ def jointCoverOrthogonal( free, x, y, nx, ny ):
     else:
         assert False
 
-def decompose( coords ):
-    free = set( coords )
-    components = []
-    visited = set()
-    
-    def dfs( x, y ):
-        # Only consider each square once
-        if (x,y) in visited:
-            return
-        visited.add( (x,y) )
-
-        # If we cannot cover the square, leave it out
-        # of the decomposition.
-        if not canCover( free, x, y ):
-            return
-
-        # Otherwise add it to the current component
-        components[-1].append( (x,y) )
-
-        # And visit its orthogonal neighbors
-        for (nx, ny) in [ (x+1,y), (x-1,y), (x,y-1), (x,y+1) ]:
-            # Must be a free square
-            if not (nx,ny) in free:
-                continue
-
-            # Must have a 2x2 square that covers both!
-            # otherwise there is no interaction between the regions, i.e.
-            #  xx
-            #  xx
-            #   xx
-            #   xx
-            if not jointCoverOrthogonal( free, x, y, nx, ny ):
-                continue
-            
-            dfs( nx, ny )
-
-    for (x,y) in free:
-        if (x,y) in visited:
-            continue
-        components.append( [] )
-        dfs( x,y )
-        if len( components[-1] ) == 0:
-            # Did not find any new squares
-            components.pop()
+def components( bits, stride ):
+    """Split a bitboard into independent regions.
 
-    return components
+    Two moves interact if they overlap, so each region is the squares
+    covered by one connected group of overlapping moves.  Squares that no
+    move can cover are left out."""
+    moves = moveMask( bits, stride )
+    regions = []
+    while moves:
+        region = moves & -moves
+        while True:
+            grown = touchMask( region, stride ) & moves
+            if grown == region:
+                break
+            region = grown
+        moves ^= region
+        regions.append( coverMask( region, stride ) )
+    return regions
+
+def decompose( coords ):
+    shape = asShape( coords )
+    return [ unpack( r, shape.stride, shape.x0, shape.y0 )
+             for r in components( shape.bits, shape.stride ) ]
 
 def test():
     coords = [ (0,0), (1,0),
@@ -133,25 +212,110 @@ def test():
 if __name__ == "__main__":
     test()
 
-def makeMove( shape, coord ):
-    squares = set( shape.coords )
-    x,y = coord
-    squares.remove( (x,y) )
-    squares.remove( (x+1,y) )
-    squares.remove( (x,y+1) )
-    squares.remove( (x+1,y+1) )
+def regionMoves( shape ):
+    """Bitboard of the valid moves on shape if they form a single region,
+    as every shape returned by makeMove does, or else None."""
+    moves = moveMask( shape.bits, shape.stride )
+    if moves == 0 or len( components( shape.bits, shape.stride ) ) != 1:
+        return None
+    return moves
 
-    return [ Shape(p).canonical() for p in decompose( squares ) ]
+def splitMove( moves, stride, move ):
+    """Split the moves left in a region after playing move.
 
-def showMove( shape, coord ):
-    squares = set( shape.coords )
+    moves is the bitboard of valid moves in one region (see regionMoves)
+    and move is the bit of the move played.  Each group of moves left
+    over must touch one of the moves that were taken away, so only those
+    nearby seeds are examined.  If they join up within a few squares of
+    the move the region is still whole; otherwise each seed is flood
+    filled.  Returns the bitboards of moves in each region, in the same
+    order as components()."""
+    removed = touchMask( move, stride ) & moves
+    remaining = moves & ~removed
+    seeds = touchMask( removed, stride ) & remaining
+    if seeds == 0:
+        return []
+
+    # Try to join up the seeds without leaving the neighbourhood.
+    window = touchMask( touchMask( removed, stride ), stride ) & remaining
+    region = seeds & -seeds
+    while True:
+        grown = touchMask( region, stride ) & window
+        if grown == region:
+            break
+        region = grown
+    if seeds & ~region == 0:
+        return [ remaining ]
+
+    groups = []
+    while seeds:
+        region = seeds & -seeds
+        while True:
+            grown = touchMask( region, stride ) & remaining
+            if grown == region:
+                break
+            region = grown
+        groups.append( region )
+        seeds &= ~region
+    groups.sort( key = lambda g : g & -g )
+    return groups
+
+def moveBit( shape, coord ):
+    """The bit of the move at coord in the layout of shape.  Raises
+    KeyError if the 2x2 square there is not entirely free."""
     x,y = coord
-    squares.remove( (x,y) )
-    squares.remove( (x+1,y) )
-    squares.remove( (x,y+1) )
-    squares.remove( (x+1,y+1) )
+    dx = x - shape.x0
+    dy = y - shape.y0
+    if dx < 0 or dy < 0 or dx >= shape.stride - 2:
+        raise KeyError( coord )
+    move = 1 << ( dy * shape.stride + dx )
+    block = coverMask( move, shape.stride )
+    if shape.bits & block != block:
+        raise KeyError( coord )
+    return move
 
-    return [ Shape(p) for p in decompose( squares ) ]
+def removeMove( shape, coord ):
+    """Bitboard of the squares left in shape after playing at coord."""
+    block = coverMask( moveBit( shape, coord ), shape.stride )
+    return shape.bits & ~block
 
-    
+def splitRegions( shape, coord, moves = None ):
+    """Bitboards, in the layout of shape, of the regions left after
+    playing at coord.  If moves is given it must be regionMoves( shape ),
+    and only the neighbourhood of the move is re-examined; see
+    splitMove."""
+    if moves is None:
+        return components( removeMove( shape, coord ), shape.stride )
+    move = moveBit( shape, coord )
+    if native.enabled and shape.bits.bit_length() <= 128:
+        n = native.lib.split_regions( moves & native.MASK64, moves >> 64,
+                                      shape.stride, move & native.MASK64,
+                                      move >> 64, _groups )
+        if n >= 0:
+            return [ _groups[2*i] | ( _groups[2*i+1] << 64 ) for i in range( n ) ]
+    return [ coverMask( g, shape.stride )
+             for g in splitMove( moves, shape.stride, move ) ]
+
+def regionKey( region, stride, reduce = None ):
+    """Canonical key of a region, or of a simpler one with the same game
+    if reduce is true, which defaults to REDUCE."""
+    if reduce is None:
+        reduce = REDUCE
+    if reduce:
+        key = reducedKey( region, stride )
+        if key is not None:
+            return key
+    return canonicalKey( region, stride )
 
+def makeMove( shape, coord, moves = None, reduce = None ):
+    """Return the canonical regions left after playing at coord.
+
+    moves is as for splitRegions.  Regions are replaced by simpler ones
+    with the same game if reduce is true, which defaults to REDUCE."""
+    return [ Shape.fromKey( regionKey( r, shape.stride, reduce ) )
+             for r in splitRegions( shape, coord, moves ) ]
+
+def showMove( shape, coord ):
+    squares = removeMove( shape, coord )
+    return [ Shape.fromBits( r, shape.stride, shape.x0, shape.y0 )
+             for r in components( squares, shape.stride ) ]
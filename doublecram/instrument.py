@@ -0,0 +1,67 @@
+"""Counters and phase timers for the solvers.
+
+An Instruments object is a Counter, so it can be passed as the stats
+argument of the solvers in place of one.  When it is, they also count
+memo hits and misses, positions solved, moves generated and examined and
+the regions they leave, track the deepest position, and time the phases
+of generating moves:
+
+    moves      listing the distinct valid moves of a position
+    split      finding the regions each move leaves
+    canonical  reducing and canonicalizing those regions
+    mex        combining the values of the regions
+
+The first three are timed once per position.  Combining values takes
+too little time per move to time every one, so one move in SAMPLE is
+timed and the total scaled up.
+"""
+from collections import Counter
+import time
+
+PHASES = ( "moves", "split", "canonical", "mex" )
+
+SAMPLE = 16
+
+class Instruments(Counter):
+    def __init__( self ):
+        super().__init__()
+        self.seconds = Counter()
+        self.maxDepth = 0
+        self.start = time.perf_counter()
+
+    def add( self, phase, start, scale = 1 ):
+        """Charge the time since start, from time.perf_counter(), to phase,
+        multiplied by scale for a sample."""
+        self.seconds[phase] += ( time.perf_counter() - start ) * scale
+
+    def depth( self, depth ):
+        if depth > self.maxDepth:
+            self.maxDepth = depth
+
+    def snapshot( self ):
+        """One line of the main counters, for progress reports."""
+        lookups = self["hits"] + self["misses"]
+        return "solved {}, hits {:.1%}, depth {}, {}".format(
+            self["solved"], self["hits"] / lookups if lookups > 0 else 0,
+            self.maxDepth,
+            ", ".join( "{} {:.1f}s".format( p, self.seconds[p] ) for p in PHASES ) )
+
+    def summary( self ):
+        """Several lines describing the whole run so far."""
+        lookups = self["hits"] + self["misses"]
+        elapsed = time.perf_counter() - self.start
+        lines = [
+            "solved {} positions, deepest {} moves from the start".format(
+                self["solved"], self.maxDepth ),
+            "{} memo lookups, {} hits ({:.1%}), {} from the library".format(
+                lookups, self["hits"], self["hits"] / lookups if lookups > 0 else 0,
+                self["library"] ),
+            "{} moves generated, {} examined, {:.2f} regions per move".format(
+                self["generated"], self["examined"],
+                self["regions"] / self["examined"] if self["examined"] > 0 else 0 ),
+        ]
+        for p in PHASES:
+            lines.append( "{:10s} {:8.2f}s {:5.1%}".format(
+                p, self.seconds[p], self.seconds[p] / elapsed if elapsed > 0 else 0 ) )
+        lines.append( "{:10s} {:8.2f}s".format( "total", elapsed ) )
+        return "\n".join( lines )
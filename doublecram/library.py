@@ -0,0 +1,66 @@
+"""Precomputed nim-values of every region that fits in a small box.
+
+The library is a table file (see tablefile.py) in doublecram/data, built
+with grid.shape.enumerate and loaded once at import.  Its name carries
+VERSION, which must be increased whenever the canonical keys or the
+rules change, so that a stale file is rebuilt instead of being trusted.
+
+    python -m doublecram.library [box]
+
+rebuilds the file for a box x box bounding box.
+"""
+import os
+
+from grid.shape import enumerate as enumerateShapes
+from doublecram import tablefile
+
+VERSION = 1
+BOX = 5
+DATA = os.path.join( os.path.dirname( __file__ ), "data" )
+
+def path( box = BOX ):
+    return os.path.join( DATA, "small-{}x{}-v{}.dcnv".format( box, box, VERSION ) )
+
+def regions( box ):
+    """Generate every canonical region, as makeMove returns them, that
+    fits in a box x box square."""
+    return enumerateShapes( box, connected = True, trimmed = True )
+
+def build( box = BOX ):
+    """Solve every region that fits in the box and return their values.
+    The library already loaded is set aside meanwhile, so that every
+    value is computed afresh."""
+    from doublecram.solve import SMALL, solve_position
+    small = dict( SMALL )
+    SMALL.clear()
+    values = {}
+    try:
+        for s in regions( box ):
+            # Strips have a closed form and are not stored by the solver.
+            values[s.key()] = solve_position( s, values )
+    finally:
+        SMALL.update( small )
+    return values
+
+def load( box = BOX ):
+    """Return the library as a dict, building and saving it if there is
+    no file for this version."""
+    try:
+        return tablefile.load( path( box ) )
+    except FileNotFoundError:
+        pass
+    values = build( box )
+    try:
+        os.makedirs( DATA, exist_ok = True )
+        tablefile.save( values, path( box ) )
+    except OSError:
+        pass
+    return values
+
+if __name__ == "__main__":
+    import sys
+    box = int( sys.argv[1] ) if len( sys.argv ) > 1 else BOX
+    values = build( box )
+    os.makedirs( DATA, exist_ok = True )
+    tablefile.save( values, path( box ) )
+    print( "wrote", len( values ), "regions to", path( box ) )
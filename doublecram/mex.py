@@ -6,7 +6,7 @@ def nim_addition( *values ):
     return a
             
 def mex( nimbers ):
-    x = set( nimbers )
+    x = nimbers if isinstance( nimbers, (set, frozenset) ) else set( nimbers )
     for n in range( 0, len( nimbers ) + 1 ):
         if n not in x:
             return n
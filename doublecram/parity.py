@@ -0,0 +1,24 @@
+"""Check that the C kernel and the Python code solve boards identically.
+
+    python -m doublecram.parity [size]
+
+solves every m x n board up to size x size, 7 by default, both ways; see
+verify_native.
+"""
+from grid import Shape, native
+from doublecram.solve import verify_native
+
+def test( size = 7 ):
+    if native.lib is None:
+        print( "grid._kernel is not built; run python -m grid.build_kernel" )
+        return
+    for m in range( 2, size + 1 ):
+        for n in range( m, size + 1 ):
+            board = Shape( [ (x,y) for x in range( n ) for y in range( m ) ] )
+            wrong, fastSize, plainSize = verify_native( board.canonical() )
+            assert wrong == [], ( m, n, wrong[:10] )
+            print( "{} x {}: {} positions agree".format( m, n, plainSize ) )
+
+if __name__ == "__main__":
+    import sys
+    test( int( sys.argv[1] ) if len( sys.argv ) > 1 else 7 )
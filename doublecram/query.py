@@ -0,0 +1,213 @@
+"""Answer questions about arbitrary positions from a table of nim-values.
+
+An Oracle wraps a table, as solved by main.py or loaded from a file, and
+gives the value of a position, its winning moves and the best reply to a
+move.  A position is a Shape or a collection of free squares, and may
+fall apart into several regions; moves are given in its own coordinates.
+
+The regions of each position and their values are found once and
+remembered, as is the value left by every move in a region, so repeated
+queries about positions from the same game cost a few dictionary
+lookups.  A region the table lacks, such as one a bounded solve never
+needed, is solved and remembered unless the Oracle was made with
+solve = False, in which case the query raises KeyError.
+
+    python -m doublecram.query TABLE M [N]
+
+prints the value and winning moves of the M x N board from a table file.
+"""
+from grid import Shape
+from doublecram.doublecram import asShape, components, moveMask, regionKey
+from doublecram.doublecram import moveBit, removeMove, splitRegions
+from doublecram.solve import SMALL, solve_position
+from doublecram.sums import closedForm
+
+def _coord( bit, shape ):
+    i = bit.bit_length() - 1
+    return ( shape.x0 + i % shape.stride, shape.y0 + i // shape.stride )
+
+class Oracle(object):
+    """Queries against the table values, which may be any of the tables
+    the solvers take or a tablefile.TableFile.  Each of the memos is
+    emptied when it reaches maxEntries."""
+
+    def __init__( self, values, solve = True, maxEntries = 1 << 20 ):
+        self.table = values
+        self.solve = solve
+        self.maxEntries = maxEntries
+        self.keyValues = {}
+        self.positions = {}
+        self.moveValues = {}
+
+    def regionValue( self, key ):
+        """Nim-value of the region with canonical key."""
+        value = self.keyValues.get( key )
+        if value is not None:
+            return value
+        value = self.table.get( key )
+        if value is None:
+            value = SMALL.get( key )
+        if value is None:
+            value = closedForm( key )
+        if value is None:
+            if not self.solve:
+                raise KeyError( "region {:#x} is not in the table".format( key ) )
+            if len( self.keyValues ) >= self.maxEntries:
+                self.keyValues.clear()
+            value = solve_position( Shape.fromKey( key ), self.keyValues )
+        self.keyValues[key] = value
+        return value
+
+    def _regions( self, shape ):
+        """(region, value) for each region of shape, as bitboards in its
+        layout."""
+        entry = self.positions.get( ( shape.bits, shape.stride ) )
+        if entry is not None:
+            return entry
+        entry = [ ( r, self.regionValue( regionKey( r, shape.stride ) ) )
+                  for r in components( shape.bits, shape.stride ) ]
+        if len( self.positions ) >= self.maxEntries:
+            self.positions.clear()
+        self.positions[( shape.bits, shape.stride )] = entry
+        return entry
+
+    def _after( self, region, stride ):
+        """(move, value) for each move in a region, where value is that of
+        what the move leaves of the region."""
+        entry = self.moveValues.get( ( region, stride ) )
+        if entry is not None:
+            return entry
+        s = Shape.fromBits( region, stride )
+        moves = moveMask( region, stride )
+        entry = []
+        m = moves
+        while m:
+            bit = m & -m
+            m ^= bit
+            value = 0
+            for r in splitRegions( s, _coord( bit, s ), moves ):
+                value ^= self.regionValue( regionKey( r, stride ) )
+            entry.append( ( bit, value ) )
+        if len( self.moveValues ) >= self.maxEntries:
+            self.moveValues.clear()
+        self.moveValues[( region, stride )] = entry
+        return entry
+
+    def value( self, shape ):
+        """Nim-value of a position; it is a loss for the player to move
+        if this is zero."""
+        total = 0
+        for r, v in self._regions( asShape( shape ) ):
+            total ^= v
+        return total
+
+    def moves( self, shape ):
+        """Sorted list of (move, value) for every valid move, where value
+        is that of the position the move leaves."""
+        shape = asShape( shape )
+        regions = self._regions( shape )
+        total = 0
+        for r, v in regions:
+            total ^= v
+        result = []
+        for r, v in regions:
+            for bit, after in self._after( r, shape.stride ):
+                result.append( ( _coord( bit, shape ), total ^ v ^ after ) )
+        result.sort()
+        return result
+
+    def winningMoves( self, shape ):
+        """Every move that leaves a position of value zero, in order."""
+        return [ move for move, value in self.moves( shape ) if value == 0 ]
+
+    def play( self, shape, move ):
+        """The position left after playing move."""
+        shape = asShape( shape )
+        try:
+            moveBit( shape, move )
+        except KeyError:
+            raise ValueError( "{} is not a valid move".format( move ) ) from None
+        return Shape.fromBits( removeMove( shape, move ), shape.stride,
+                               shape.x0, shape.y0 )
+
+    def bestReply( self, shape, move ):
+        """The first winning move after move is played on shape.  If there
+        is none, the first move that leaves the largest value, or None if
+        there is no move at all."""
+        moves = self.moves( self.play( shape, move ) )
+        for reply, value in moves:
+            if value == 0:
+                return reply
+        if len( moves ) == 0:
+            return None
+        return max( moves, key = lambda mv : mv[1] )[0]
+
+    def values( self, shapes ):
+        """value() of each position."""
+        return [ self.value( s ) for s in shapes ]
+
+    def allWinningMoves( self, shapes ):
+        """winningMoves() of each position."""
+        return [ self.winningMoves( s ) for s in shapes ]
+
+    def bestReplies( self, queries ):
+        """bestReply() for each (shape, move) pair."""
+        return [ self.bestReply( s, move ) for s, move in queries ]
+
+def load( path ):
+    """An Oracle over a table file, an SQLite store (.db) or a results/
+    dump (.txt)."""
+    from doublecram import store, tablefile
+    if path.endswith( ".txt" ):
+        return Oracle( tablefile.parseResults( path ) )
+    if path.endswith( ".db" ):
+        return Oracle( store.ValueStore( path ) )
+    return Oracle( tablefile.TableFile( path ) )
+
+def test():
+    import random
+    import time
+    from doublecram.doublecram import validMoves
+
+    board = [ (x,y) for x in range( 6 ) for y in range( 6 ) ]
+    oracle = Oracle( {} )
+    assert oracle.value( board ) == 4
+
+    # Compare with solving each position left by a move from scratch.
+    random.seed( 1 )
+    positions = [ board ]
+    for i in range( 30 ):
+        s = [ c for c in board if random.random() < 0.8 ]
+        positions.append( s )
+    for s in positions:
+        for move, value in oracle.moves( s ):
+            left = oracle.play( s, move )
+            total = 0
+            for r in components( left.bits, left.stride ):
+                total ^= solve_position( Shape.fromBits( r, left.stride ).canonical(), {} )
+            assert total == value, ( s, move )
+        assert [ m for m, v in oracle.moves( s ) ] == validMoves( s )
+
+    # Time the queries once everything they need is remembered.
+    queries = [ ( s, move ) for s in positions for move in validMoves( s ) ]
+    oracle.bestReplies( queries )
+    start = time.perf_counter()
+    oracle.bestReplies( queries )
+    took = time.perf_counter() - start
+    print( "{} best replies, {:.0f} us each".format( len( queries ),
+                                                     took / len( queries ) * 1e6 ) )
+
+if __name__ == "__main__":
+    import sys
+    if len( sys.argv ) == 1:
+        test()
+        sys.exit( 0 )
+    if len( sys.argv ) not in ( 3, 4 ):
+        print( "usage: python -m doublecram.query [TABLE M [N]]", file = sys.stderr )
+        sys.exit( 2 )
+    oracle = load( sys.argv[1] )
+    m = int( sys.argv[2] )
+    n = int( sys.argv[3] ) if len( sys.argv ) > 3 else m
+    board = [ (x,y) for x in range( n ) for y in range( m ) ]
+    print( "{} x {} has nim-value {}".format( m, n, oracle.value( board ) ) )
+    print( "winning moves:", oracle.winningMoves( board ) )
@@ -0,0 +1,85 @@
+"""Reporters the solvers call as each position is solved.
+
+A reporter has a solved( shape, value, depth ) method, where depth is the
+number of moves from the root, or None when the solver does not know it.
+The solvers are silent when no reporter is given.
+"""
+import json
+import sys
+import time
+
+class TextLog(object):
+    """Write each position as an ASCII picture followed by its nim-value,
+    the format of the files in results/."""
+    def __init__( self, out, n = 10 ):
+        self.out = out
+        self.rule = "-" * n + "\n"
+
+    def solved( self, shape, value, depth ):
+        self.out.write( self.rule + shape.plot() + "\n" + self.rule +
+                        "has nim-value {}\n".format( value ) )
+
+class JsonLog(object):
+    """Write one JSON record per position, buffering `batch` records
+    between writes."""
+    def __init__( self, out, batch = 4096 ):
+        self.out = out
+        self.batch = batch
+        self.pending = []
+
+    def solved( self, shape, value, depth ):
+        self.pending.append( json.dumps(
+            { "key" : hex( shape.key() ), "value" : value, "depth" : depth } ) )
+        if len( self.pending ) >= self.batch:
+            self.flush()
+
+    def flush( self ):
+        if len( self.pending ) > 0:
+            self.out.write( "\n".join( self.pending ) + "\n" )
+            self.pending = []
+
+class Progress(object):
+    """Every `interval` seconds, print the solving rate, the size of the
+    values table and the current depth, followed by a snapshot of profile
+    if there is one."""
+    def __init__( self, table, interval = 10.0, out = sys.stderr,
+                  profile = None ):
+        self.table = table
+        self.profile = profile
+        self.interval = interval
+        self.out = out
+        self.count = 0
+        self.start = time.monotonic()
+        self.last = self.start
+        self.lastCount = 0
+
+    def solved( self, shape, value, depth ):
+        self.count += 1
+        # Only look at the clock now and then
+        if self.count & 0xff != 0:
+            return
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            rate = ( self.count - self.lastCount ) / ( now - self.last )
+            self.out.write( "{:.0f}s: {} solved, {:.0f}/s, table {}, depth {}\n".format(
+                now - self.start, self.count, rate, len( self.table ),
+                "-" if depth is None else depth ) )
+            if self.profile is not None:
+                self.out.write( "    " + self.profile.snapshot() + "\n" )
+            self.out.flush()
+            self.last = now
+            self.lastCount = self.count
+
+class Reporters(object):
+    """Pass each position on to several reporters."""
+    def __init__( self, *reporters ):
+        self.reporters = reporters
+
+    def solved( self, shape, value, depth ):
+        for r in self.reporters:
+            r.solved( shape, value, depth )
+
+    def flush( self ):
+        for r in self.reporters:
+            if hasattr( r, "flush" ):
+                r.flush()
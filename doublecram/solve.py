@@ -1,54 +1,477 @@
-from grid import Shape
-from grid.shape import plot_text
-from doublecram.doublecram import validMoves, makeMove
+from grid import Shape, native
+from grid.canonical import cells
+from doublecram import library
+import doublecram.doublecram
+from doublecram.cache import children, expand, iterExpand
+from doublecram.doublecram import distinctMoves
+from doublecram.instrument import Instruments, SAMPLE
 from doublecram.mex import mex, nim_addition
+from doublecram.report import TextLog
+from doublecram.sums import SumMemo, cancel, closedForm
 
-def solve_position( shape, shape_values ):
+import multiprocessing
+import time
+
+# Nim-values of the small regions, filled in from the library below
+SMALL = {}
+
+# Nim-values of sums of regions; these depend only on the rules, so one
+# memo serves every table.
+SUMS = SumMemo()
+
+def solve_position( shape, shape_values, cache = None, stats = None,
+                    report = None, depth = 0 ):
+    profile = stats if isinstance( stats, Instruments ) else None
     key = shape.key()
     if key in shape_values:
+        if profile is not None:
+            profile["hits"] += 1
         return shape_values[key]
+    value = SMALL.get( key )
+    if value is not None:
+        if profile is not None:
+            profile["library"] += 1
+        shape_values[key] = value
+        return value
+    value = closedForm( key )
+    if value is not None:
+        return value
 
-    vm = validMoves(shape.coords)
+    if profile is not None:
+        profile["misses"] += 1
+        profile["solved"] += 1
+        profile.depth( depth )
+    vm = children( shape, cache, profile )
+    if profile is not None:
+        profile["generated"] += len( vm )
     if len( vm ) == 0:        
         shape_values[key] = 0
         return 0
 
+    # No position can have a nim-value above the length of the longest
+    # game from it, so once every value below that is taken the
+    # remaining moves cannot change the result.
+    bound = min( len( vm ), cells( key ) // 4 )
+
     # Find the nim-values of each successor position
     successorValues = set()
-    for move in vm:
-        partition = makeMove( shape, move )
+    value = 0
+    for i, (move, partition) in enumerate( vm ):
+        if value == bound:
+            if stats is not None:
+                stats["skipped"] += len( vm ) - i
+            break
+
+        if profile is not None:
+            profile["examined"] += 1
+            profile["regions"] += len( partition )
         if len( partition ) == 0:
             # print( move, [], "=", 0 )
-            successorValues.add( 0 )
-            continue
-
-        sub_positions = [ solve_position( s, shape_values )
-                          for s in partition ]
-        total = nim_addition( *sub_positions )
-        #print( move, sub_positions, "=", total )
+            total = 0
+        else:
+            total = SUMS.value( partition, shape_values,
+                                lambda k : solve_position(
+                                    Shape.fromKey( k ), shape_values, cache,
+                                    stats, report, depth + 1 ),
+                                profile )
+        timed = profile is not None and profile["examined"] % SAMPLE == 0
+        if timed:
+            start = time.perf_counter()
         successorValues.add( total )
+        while value in successorValues:
+            value += 1
+        if timed:
+            profile.add( "mex", start, SAMPLE )
 
-    value = mex( successorValues )
-    plot_text( [shape] )
-    print( "has nim-value", value )
+    if report is not None:
+        report.solved( shape, value, depth )
     shape_values[key] = value
     return value
 
-def solve_square(n, values=None):
-    coords = [(x,y) for x in range(n) for y in range(n)]
+def is_loss( partition, shape_values, outcomes = None, cache = None,
+             stats = None, report = None, depth = 0 ):
+    """Is the sum of the regions with these keys a loss for the player to
+    move?  depth is the depth of the regions."""
+    left = cancel( partition )
+    if len( left ) == 0:
+        return True
+    if len( left ) == 1:
+        return not solve_outcome( Shape.fromKey( left[0] ), shape_values,
+                                  outcomes, cache, stats, report, depth )
+    sub_positions = [ solve_position( Shape.fromKey( k ), shape_values,
+                                      cache, stats, report, depth )
+                      for k in left ]
+    return nim_addition( *sub_positions ) == 0
+
+def solve_outcome( shape, shape_values, outcomes = None, cache = None,
+                   stats = None, report = None, depth = 0 ):
+    """Return whether the player to move wins from shape.
+
+    Unlike solve_position this stops at the first winning move.  A move
+    leaving a single region (after cancelling identical pairs) only needs
+    that region's outcome, which is stored in outcomes; moves leaving
+    several regions need their nim-values, so they are tried last and
+    solved with solve_position."""
+    if outcomes is None:
+        outcomes = {}
+    key = shape.key()
+    if key in shape_values:
+        return shape_values[key] != 0
+    if key in SMALL:
+        return SMALL[key] != 0
+    if key in outcomes:
+        return outcomes[key]
+
+    if cache is not None:
+        moves = children( shape, cache )
+        count = len( moves )
+    else:
+        distinct = distinctMoves( shape )
+        moves = iterExpand( shape, moves = distinct )
+        count = len( distinct )
+    seen = 0
+    win = False
+    sums = []
+    for move, partition in moves:
+        seen += 1
+        left = cancel( partition )
+        if len( left ) > 1:
+            sums.append( left )
+            continue
+        if is_loss( left, shape_values, outcomes, cache, stats, report,
+                    depth + 1 ):
+            win = True
+            break
+
+    if not win:
+        for i, left in enumerate( sums ):
+            if is_loss( left, shape_values, outcomes, cache, stats, report,
+                        depth + 1 ):
+                win = True
+                if stats is not None:
+                    stats["skipped"] += len( sums ) - i - 1
+                break
+    elif stats is not None:
+        stats["skipped"] += len( sums ) + count - seen
+
+    outcomes[key] = win
+    return win
+
+class _Frame(object):
+    __slots__ = ( "shape", "key", "moves", "bound", "index", "partition",
+                  "known", "successors", "value" )
+
+    def __init__( self, shape, key, cache, profile ):
+        self.shape = shape
+        self.key = key
+        self.moves = children( shape, cache, profile )
+        self.bound = min( len( self.moves ), cells( key ) // 4 )
+        self.index = 0
+        self.partition = None
+        self.known = []
+        self.successors = set()
+        self.value = 0
+
+class IterativeSolver(object):
+    """Solve a position like solve_position, but with an explicit stack
+    of positions in progress instead of recursion.
+
+    If run() is interrupted, for example by KeyboardInterrupt, the stack
+    is left consistent and calling run() again carries on from where it
+    stopped.  frontier() is the number of positions on the stack and
+    maxFrontier the largest it has been.
+
+    checkpoint, if given, is called with the solver every few thousand
+    steps, between which the stack is consistent; state() and restore()
+    save and reload the stack.  See checkpoint.py."""
+
+    def __init__( self, shape, shape_values, cache = None, stats = None,
+                  report = None, checkpoint = None ):
+        self.root = shape.key()
+        self.shape_values = shape_values
+        self.cache = cache
+        self.stats = stats
+        self.profile = stats if isinstance( stats, Instruments ) else None
+        self.report = report
+        self.checkpoint = checkpoint
+        self.stack = []
+        self.steps = 0
+        self.maxFrontier = 0
+        self.value = shape_values.get( self.root )
+        if self.value is None:
+            self._push( shape, self.root )
+
+    def _push( self, shape, key ):
+        frame = _Frame( shape, key, self.cache, self.profile )
+        self.stack.append( frame )
+        if len( self.stack ) > self.maxFrontier:
+            self.maxFrontier = len( self.stack )
+        if self.profile is not None:
+            self.profile["misses"] += 1
+            self.profile["generated"] += len( frame.moves )
+            self.profile.depth( len( self.stack ) - 1 )
+
+    def frontier( self ):
+        return len( self.stack )
+
+    def state( self ):
+        """A picklable copy of the work in progress."""
+        return { "root" : self.root, "stack" : self.stack, "steps" : self.steps }
+
+    def restore( self, state ):
+        """Carry on from state(), saved by a solver of the same position."""
+        if state["root"] != self.root:
+            raise ValueError( "saved state is of a different position" )
+        self.stack = state["stack"]
+        self.steps = state["steps"]
+        self.maxFrontier = max( self.maxFrontier, len( self.stack ) )
+
+    def run( self ):
+        shape_values = self.shape_values
+        stack = self.stack
+        profile = self.profile
+        checkpoint = self.checkpoint
+        while len( stack ) > 0:
+            self.steps += 1
+            if checkpoint is not None and self.steps & 0xfff == 0:
+                checkpoint( self )
+            frame = stack[-1]
+            if frame.partition is None:
+                if frame.value == frame.bound or \
+                   frame.index == len( frame.moves ):
+                    # See solve_position for why the bound is safe.
+                    if self.stats is not None:
+                        self.stats["skipped"] += len( frame.moves ) - frame.index
+                    if self.report is not None:
+                        self.report.solved( frame.shape, frame.value,
+                                            len( stack ) - 1 )
+                    shape_values[frame.key] = frame.value
+                    stack.pop()
+                    if profile is not None:
+                        profile["solved"] += 1
+                    if len( stack ) == 0:
+                        self.value = frame.value
+                    continue
+                partition = frame.moves[frame.index][1]
+                if profile is not None:
+                    profile["examined"] += 1
+                    profile["regions"] += len( partition )
+                if len( partition ) > 1:
+                    partition = cancel( partition )
+                total = SUMS.get( partition ) if len( partition ) > 1 else None
+                if total is not None:
+                    frame.successors.add( total )
+                    while frame.value in frame.successors:
+                        frame.value += 1
+                    frame.index += 1
+                    continue
+                frame.partition = partition
+
+            # Solve the first unsolved component, then come back to
+            # this move.  Values are kept as they are found, since a
+            # bounded table may drop them again.
+            known = frame.known
+            while len( known ) < len( frame.partition ):
+                key = frame.partition[len( known )]
+                value = shape_values.get( key )
+                if value is not None:
+                    if profile is not None:
+                        profile["hits"] += 1
+                else:
+                    value = closedForm( key )
+                if value is None:
+                    value = SMALL.get( key )
+                    if value is None:
+                        self._push( Shape.fromKey( key ), key )
+                        break
+                    shape_values[key] = value
+                    if profile is not None:
+                        profile["library"] += 1
+                known.append( value )
+            else:
+                timed = profile is not None and self.steps % SAMPLE == 0
+                if timed:
+                    start = time.perf_counter()
+                if len( known ) == 0:
+                    frame.successors.add( 0 )
+                else:
+                    total = nim_addition( *known )
+                    frame.successors.add( total )
+                    if len( known ) > 1:
+                        SUMS.put( frame.partition, total )
+                while frame.value in frame.successors:
+                    frame.value += 1
+                if timed:
+                    profile.add( "mex", start, SAMPLE )
+                frame.partition = None
+                frame.known = []
+                frame.index += 1
+
+        return self.value
+
+def _expand( key ):
+    """Return key with the distinct partitions its moves lead to, each as
+    a sorted tuple of canonical keys."""
+    partitions = set( tuple( sorted( keys ) )
+                      for move, keys in expand( Shape.fromKey( key ) ) )
+    return key, list( partitions )
+
+def solve_parallel( shape, shape_values, workers, chunksize = 32,
+                    report = None ):
+    """Solve shape using a pool of worker processes.
+
+    The game is explored breadth first: each unsolved canonical position
+    is sent to exactly one worker, which lists the partitions its moves
+    lead to, starting with the root's own makeMove partitions.  Once
+    every position is known they are valued in this process from the
+    smallest up, since each child is smaller than its parent, and the
+    values are merged into shape_values.  The values used are kept aside
+    as they are found, since a bounded table may drop them."""
+    root = shape.key()
+    if root in shape_values:
+        return shape_values[root]
+
+    children = {}
+    known = {}
+    level = [ root ]
+    seen = set( level )
+    with multiprocessing.Pool( workers ) as pool:
+        while len( level ) > 0:
+            nextLevel = []
+            for key, partitions in pool.imap_unordered( _expand, level, chunksize ):
+                children[key] = partitions
+                for partition in partitions:
+                    for k in partition:
+                        if k in seen:
+                            continue
+                        seen.add( k )
+                        value = shape_values.get( k )
+                        if value is None and k in SMALL:
+                            value = shape_values[k] = SMALL[k]
+                        if value is None:
+                            value = closedForm( k )
+                        if value is None:
+                            nextLevel.append( k )
+                        else:
+                            known[k] = value
+            level = nextLevel
+
+    for key in sorted( children, key = cells ):
+        successorValues = set()
+        for partition in children.pop( key ):
+            if len( partition ) == 0:
+                successorValues.add( 0 )
+            else:
+                successorValues.add( nim_addition( *[ known[k] for k in partition ] ) )
+        known[key] = shape_values[key] = mex( successorValues )
+        if report is not None:
+            report.solved( Shape.fromKey( key ), known[key], None )
+    return known[root]
+
+def verify_reduction( shape ):
+    """Solve shape without makeMove's reductions or the small-shape
+    library, then check that every position found has the same value
+    when solved with them.  Returns the keys of any that differ, and the
+    sizes of the two tables."""
+    plain = {}
+    small = dict( SMALL )
+    SMALL.clear()
+    doublecram.doublecram.REDUCE = False
+    try:
+        IterativeSolver( shape, plain ).run()
+    finally:
+        doublecram.doublecram.REDUCE = True
+        SMALL.update( small )
+    reduced = {}
+    wrong = [ key for key in plain
+              if solve_position( Shape.fromKey( key ), reduced ) != plain[key] ]
+    return wrong, len( plain ), len( reduced )
+
+def verify_native( shape ):
+    """Solve shape with the C kernel and again without it, each from an
+    empty table and sum memo and without the small-shape library, and
+    check the two tables match.  Returns the keys whose values differ or
+    that only one table has, and the sizes of the two tables."""
+    tables = []
+    enabled = native.enabled
+    small = dict( SMALL )
+    SMALL.clear()
+    try:
+        for on in ( True, False ):
+            native.setNative( on )
+            SUMS.entries.clear()
+            values = {}
+            IterativeSolver( shape, values ).run()
+            tables.append( values )
+    finally:
+        native.setNative( enabled )
+        SUMS.entries.clear()
+        SMALL.update( small )
+    fast, plain = tables
+    wrong = [ key for key in fast.keys() | plain.keys()
+              if fast.get( key ) != plain.get( key ) ]
+    return wrong, len( fast ), len( plain )
+
+def _solve( coords, values, workers, cache, stats, report, checkpoint = None,
+            resume = None ):
     start = Shape( coords ).canonical()
     if values is None:
         values = {}
-    val = solve_position( start, values )
+    if workers > 1:
+        val = solve_parallel( start, values, workers, report = report )
+    else:
+        solver = IterativeSolver( start, values, cache, stats, report,
+                                  checkpoint )
+        if resume is not None:
+            solver.restore( resume )
+        val = solver.run()
     return start, val, values
 
-def solve_mn(m, n, values=None):
+def solve_square(n, values=None, workers=1, cache=None, stats=None,
+                 report=None, checkpoint=None, resume=None):
+    """Solve the n x n board.  checkpoint is called periodically as
+    IterativeSolver describes, and resume is a saved solver state to
+    carry on from; neither works with several workers."""
+    coords = [(x,y) for x in range(n) for y in range(n)]
+    return _solve( coords, values, workers, cache, stats, report,
+                   checkpoint, resume )
+
+def solve_mn(m, n, values=None, workers=1, cache=None, stats=None,
+             report=None, checkpoint=None, resume=None):
     coords = [(x,y) for x in range(n) for y in range(m)]
-    start = Shape( coords ).canonical()
+    return _solve( coords, values, workers, cache, stats, report,
+                   checkpoint, resume )
+
+def solve_strips(m, n=None, values=None, workers=1, cache=None, stats=None,
+                 report=None, max_cells=None, start=2, checkpoint=None,
+                 resume=None):
+    """Solve the m x start, m x (start+1), ... boards in turn, up to m x n
+    or forever if n is None, yielding (width, value) as each is known.
+    checkpoint and resume are as for solve_square; resume applies to
+    the first width only.
+
+    Every board shares the one values table, so each width starts from
+    all the regions the narrower boards solved.  Every such region still
+    fits in a wider board, so nothing is ever strictly unreachable; to
+    bound memory, a dict table drops the positions with more than
+    max_cells squares after each width, and they are solved again if a
+    wider board reaches them."""
     if values is None:
         values = {}
-    val = solve_position( start, values )
-    return start, val, values
+    width = start
+    while n is None or width <= n:
+        coords = [(x,y) for x in range(width) for y in range(m)]
+        board, val, values = _solve( coords, values, workers, cache, stats,
+                                     report, checkpoint, resume )
+        resume = None
+        yield width, val
+        if max_cells is not None and isinstance( values, dict ):
+            for key in [ k for k in values if cells( k ) > max_cells ]:
+                del values[key]
+        width += 1
     
+SMALL.update( library.load() )
+
 if __name__ == "__main__":
-    solve_square( 4 )
+    import sys
+    solve_square( 4, report = TextLog( sys.stdout ) )
@@ -0,0 +1,98 @@
+"""Nim-values kept in an SQLite file so that they survive between runs."""
+import sqlite3
+
+def encodeKey( key ):
+    """Bytes for a Shape.key(), which is a non-negative integer."""
+    return key.to_bytes( ( key.bit_length() + 7 ) // 8, "little" )
+
+def decodeKey( blob ):
+    return int.from_bytes( blob, "little" )
+
+class ValueStore(object):
+    """A table of nim-values keyed by canonical Shape.key() that can be
+    passed to solve_position in place of a dict.
+
+    Lookups read through to the database and new values are written back
+    in batches.  Several solver processes may share one file: it is opened
+    in WAL mode, and since every process computes the same value for a
+    shape, rows are inserted with INSERT OR IGNORE."""
+
+    def __init__( self, path, batch = 1000, timeout = 60.0 ):
+        self.path = path
+        self.batch = batch
+        self.conn = sqlite3.connect( path, timeout = timeout )
+        self.conn.execute( "PRAGMA journal_mode=WAL" )
+        self.conn.execute( "PRAGMA synchronous=NORMAL" )
+        self.conn.execute( "CREATE TABLE IF NOT EXISTS nim_values "
+                           "(shape BLOB PRIMARY KEY, value INTEGER NOT NULL) "
+                           "WITHOUT ROWID" )
+        self.conn.commit()
+        self.cache = {}
+        self.pending = []
+
+    def _fetch( self, key ):
+        row = self.conn.execute( "SELECT value FROM nim_values WHERE shape = ?",
+                                 ( encodeKey( key ), ) ).fetchone()
+        if row is None:
+            return None
+        self.cache[key] = row[0]
+        return row[0]
+
+    def __contains__( self, key ):
+        return key in self.cache or self._fetch( key ) is not None
+
+    def __getitem__( self, key ):
+        if key in self.cache:
+            return self.cache[key]
+        value = self._fetch( key )
+        if value is None:
+            raise KeyError( key )
+        return value
+
+    def get( self, key, default = None ):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__( self, key, value ):
+        if self.cache.get( key ) == value:
+            return
+        self.cache[key] = value
+        self.pending.append( ( encodeKey( key ), value ) )
+        if len( self.pending ) >= self.batch:
+            self.flush()
+
+    def __len__( self ):
+        self.flush()
+        return self.conn.execute( "SELECT COUNT(*) FROM nim_values" ).fetchone()[0]
+
+    def items( self ):
+        """Iterate over every (key, value) in the database."""
+        self.flush()
+        for blob, value in self.conn.execute( "SELECT shape, value FROM nim_values" ):
+            yield decodeKey( blob ), value
+
+    def update( self, other ):
+        for key, value in other.items():
+            self[key] = value
+
+    def flush( self ):
+        """Write any new values to the database."""
+        if len( self.pending ) == 0:
+            return
+        with self.conn:
+            self.conn.executemany( "INSERT OR IGNORE INTO nim_values "
+                                   "(shape, value) VALUES (?, ?)",
+                                   self.pending )
+        self.pending = []
+
+    def close( self ):
+        self.flush()
+        self.conn.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc ):
+        self.close()
@@ -0,0 +1,116 @@
+"""Nim-values of the sums of regions a move leaves.
+
+The value of a sum is the nim-sum of the values of its regions, so
+identical pairs cancel, and SumMemo remembers the value of whole
+partitions so that a repeated one costs a single lookup.  The 2 x n
+strips, which include the isolated 2x2 square and every region reduced
+to one by reducedKey, are Node Kayles on a path; their values follow
+from a short recurrence and they are never solved.
+"""
+from grid.canonical import unpackKey
+from doublecram.mex import mex
+
+_kayles = [ 0 ]
+
+def kayles( n ):
+    """Nim-value of Node Kayles on a path of n vertices, which is the
+    game on a 2 x (n+1) strip: each move takes away a vertex and its
+    neighbours."""
+    while len( _kayles ) <= n:
+        m = len( _kayles )
+        reached = set()
+        for i in range( m ):
+            reached.add( _kayles[max( i - 1, 0 )] ^ _kayles[max( m - i - 2, 0 )] )
+        _kayles.append( mex( reached ) )
+    return _kayles[n]
+
+def stripMoves( key ):
+    """Number of moves on the region with key if it is a 2 x n strip,
+    or else None."""
+    bits, stride = unpackKey( key )
+    if stride != 3:
+        return None
+    height = ( bits.bit_length() + 2 ) // 3
+    if height < 2 or bits != ( ( 1 << ( 3 * height ) ) - 1 ) // 7 * 3:
+        return None
+    return height - 1
+
+def closedForm( key ):
+    """Nim-value of the region with key if it belongs to a family with a
+    known formula, or else None."""
+    n = stripMoves( key )
+    if n is None:
+        return None
+    return kayles( n )
+
+def cancel( keys ):
+    """Sort a partition and drop pairs of identical regions, since their
+    nim-values cancel."""
+    if len( keys ) < 2:
+        return tuple( keys )
+    left = []
+    for k in sorted( keys ):
+        if len( left ) > 0 and left[-1] == k:
+            left.pop()
+        else:
+            left.append( k )
+    return tuple( left )
+
+class SumMemo(object):
+    """Nim-values of partitions of two or more regions, keyed by the
+    tuple cancel() returns.  The memo is emptied whenever it reaches
+    maxEntries, which is cheaper than tracking the least recently used
+    entries and loses little, as partitions repeat mostly within one
+    part of the game tree."""
+
+    def __init__( self, maxEntries = 1 << 20 ):
+        self.maxEntries = maxEntries
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.resets = 0
+
+    def get( self, left ):
+        value = self.entries.get( left )
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put( self, left, value ):
+        if len( self.entries ) >= self.maxEntries:
+            self.entries.clear()
+            self.resets += 1
+        self.entries[left] = value
+
+    def value( self, keys, table, solve, profile = None ):
+        """Nim-value of the sum of the regions with keys, looking each
+        up in table or solving it with solve( key ) if it is not there
+        and has no closed form.  Table hits are counted in profile if
+        it is given."""
+        left = cancel( keys )
+        if len( left ) > 1:
+            total = self.get( left )
+            if total is not None:
+                return total
+        total = 0
+        for k in left:
+            v = table.get( k )
+            if v is None:
+                v = closedForm( k )
+                if v is None:
+                    v = solve( k )
+            elif profile is not None:
+                profile["hits"] += 1
+            total ^= v
+        if len( left ) > 1:
+            self.put( left, total )
+        return total
+
+    def __len__( self ):
+        return len( self.entries )
+
+    def stats( self ):
+        return "{} partitions, {} hits, {} misses, {} resets".format(
+            len( self.entries ), self.hits, self.misses, self.resets )
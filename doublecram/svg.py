@@ -1,6 +1,9 @@
 import svgwrite
-from doublecram.doublecram import showMove, validMoves
-from doublecram.solve import solve_square
+from doublecram.cache import MoveCache, children
+from doublecram.doublecram import showMove
+from doublecram.solve import solve_square, solve_position
+from doublecram.mex import nim_addition
+from grid import Shape
 
 red = {
     "edge_stroke" : "none",
@@ -68,20 +71,77 @@ def drawRegion( dwg, coords, x = 0, y = 0, size=10, edge_stroke = "black",
     dwg.add(g)
             
 class Position(object):
-    def __init__( self, parent, parentShape, moveCoords, partitions, values ):
+    def __init__( self, parent, parentShape, moveCoords, partitions, keys,
+                  values ):
         self.parent = [ parent ]
         self.parentShape = parentShape
         self.move = moveCoords
         self.partitions = partitions
+        self.keys = keys
         self.values = values
         
-def gameTree( shape, values, maxLevels = 4 ):
+def _plainCache( cache ):
+    """A MoveCache like cache, if there is one, for the unreduced moves
+    the trees draw."""
+    if cache is None:
+        return None
+    return MoveCache( cache.maxEntries, cache.maxChildren, reduce = False )
+
+def _moves( s, j, values, cache, plain ):
+    """Yield (key, Position) for each move on s, where s is the shape of
+    position j on the level above and key identifies the partition the
+    move leaves.  cache serves the solver and plain, from _plainCache,
+    the moves."""
+    # Draw the regions themselves rather than the simpler ones the
+    # solver may replace them with.
+    for (mx,my), keys in children( s, plain, reduce = False ):
+        keys = list( keys )
+        # Moves the solver pruned may not have values yet
+        partition_values = [ solve_position( Shape.fromKey( x ), values, cache )
+                             for x in keys ]
+        # pieces of the partition are not made canonical yet
+        partition = showMove( s, (mx,my) )
+        move_coords = set( [ (mx, my), (mx+1, my),
+                             (mx,my+1), (mx+1,my+1) ] )
+        yield tuple( sorted( keys ) ), Position( j, s, move_coords, partition,
+                                                 keys, partition_values )
+
+def _label( values ):
+    if len( values ) == 0:
+        return "0"
+    return " + ".join( "*" + str(v) for v in values )
+
+def _drawText( d, label, x, y ):
+    d.add( d.text( label,
+                   insert = ( x, y ),
+                   font_size = "10",
+                   font_family = ["Arial", "Helvetica", "sans-serif" ],
+                   text_anchor = "middle"))
+
+def _drawPosition( d, p, x, y, max_width, max_height, label = None ):
+    colors = [blue, green, purple]
+    remaining = set( p.parentShape.coords )
+    remaining.difference_update( p.move )
+    for part in p.partitions:
+        remaining.difference_update( part.coords )
+
+    drawRegion( d, remaining, x, y, edge_stroke = "none" )
+    drawRegion( d, p.move, x, y, **red )
+    for k, part in enumerate( p.partitions ):
+        drawRegion( d, part.coords, x, y, **(colors[k%len(colors)]) )
+
+    if label is None:
+        label = _label( p.values )
+    _drawText( d, label, x + max_width * 5, y + (max_height * 10 + 10) )
+
+def gameTree( shape, values, maxLevels = 4, cache = None ):
     max_width = max( x for (x,y) in shape.coords ) + 1
     max_height = max( y for (x,y) in shape.coords ) + 1
     x_spacing = (max_width + 2) * 10
     y_spacing = (max_height + 8) * 10
     min_x = 0
     
+    plain = _plainCache( cache )
     levels = [[shape]]
     for i in range( 1, maxLevels ):
         prevLevel = levels[-1]
@@ -92,31 +152,14 @@ def gameTree( shape, values, maxLevels = 4 ):
             else:
                 if len( position.partitions ) != 1:
                     continue
-                s = position.partitions[0].canonical()
+                s = Shape.fromKey( position.keys[0] )
             
-            vm = validMoves(s.coords)
-            if len( vm ) == 0:        
-                continue
-
-            for (mx,my) in vm:
-                # pieces of the partition are not made canonical yet
-                partition = showMove( s, (mx,my) )
-                canonical = [ x.canonical().key() for x in partition ]
-                partition_values = [ values[x] for x in canonical ]
-
+            for key, p in _moves( s, j, values, cache, plain ):
                 # Only show each resulting position once
-                canonical.sort()
-                key = tuple( canonical )
                 if key in nextLevel:
                     nextLevel[key].parent.append( j )
                 else:
-                    move_coords = set( [ (mx, my), (mx+1, my),
-                                         (mx,my+1), (mx+1,my+1) ] )
-                    nextLevel[key] = Position( j,
-                                               s,
-                                               move_coords,
-                                               partition,
-                                               partition_values )
+                    nextLevel[key] = p
                 
         levels.append( list( nextLevel.values() ) )
                 
@@ -132,55 +175,19 @@ def gameTree( shape, values, maxLevels = 4 ):
             else:
                 label = "*" + str( values[shape.key()] )
                 
-            d.add( d.text( label,
-                           insert = ( max_width * 5,
-                                      max_height * 10 + 10 ),
-                           font_size = "10",
-                           font_family = ["Arial", "Helvetica", "sans-serif" ],
-                           text_anchor = "middle"))
-            
+            _drawText( d, label, max_width * 5, max_height * 10 + 10 )
             continue
         numToDraw = len( level )
         x_start = -(numToDraw * x_spacing) / 2
         if x_start < min_x:
             min_x = x_start
         y_start = y_spacing * i
-        colors = [blue, green, purple]
         
         for j, p in enumerate( level ):
-            remaining = set( p.parentShape.coords )
-            remaining.difference_update( p.move )
-            for part in p.partitions:
-                remaining.difference_update( part.coords )
-
             anchors[(i,j)] = (x_start + j * x_spacing + max_width * 5,
                               y_start + max_height * 10 + 20 )
-                
-            drawRegion( d, remaining,
-                        x_start + j * x_spacing,
-                        y_start,
-                        edge_stroke = "none" )
-            drawRegion( d, p.move,
-                        x_start + j * x_spacing,
-                        y_start,
-                        **red )
-            for k, part in enumerate( p.partitions ):
-                drawRegion( d, part.coords,
-                            x_start + j * x_spacing,
-                            y_start,
-                            **(colors[k%len(colors)]) )
-
-            if len( p.partitions ) == 0:
-                label = "0"
-            else:
-                label = " + ".join( "*" + str(v) for v in p.values )
-                
-            d.add( d.text( label,
-                           insert = ( x_start + j * x_spacing + max_width * 5,
-                                      y_start + (max_height * 10 + 10) ),
-                           font_size = "10",
-                           font_family = ["Arial", "Helvetica", "sans-serif" ],
-                           text_anchor = "middle"))
+            _drawPosition( d, p, x_start + j * x_spacing, y_start,
+                           max_width, max_height )
 
             for parent_index in p.parent:
                 d.add( d.line( (x_start + j * x_spacing + max_width * 5,
@@ -192,6 +199,106 @@ def gameTree( shape, values, maxLevels = 4 ):
     d.viewbox( min_x, - x_spacing, -2 * min_x + x_spacing, (len( levels )+1) * y_spacing )
     return d
 
+class _Stream(object):
+    """Stands in for an svgwrite.Drawing, writing each element to out as
+    soon as it is added instead of keeping it."""
+    def __init__( self, out ):
+        self.out = out
+        self.factory = svgwrite.Drawing()
+
+    def __getattr__( self, name ):
+        return getattr( self.factory, name )
+
+    def add( self, element ):
+        self.out.write( element.tostring() + "\n" )
+
+def streamGameTree( shape, values, out, maxLevels = 6, maxNodes = 40,
+                    collapse = True, cache = None ):
+    """Write the game tree of shape to the file out as SVG, a level at a
+    time, holding only two levels in memory.
+
+    As in gameTree, each resulting position is shown once per level and
+    only positions of a single region are expanded.  A level shows at
+    most maxNodes positions; the rest are counted in a note.  With
+    collapse, the moves from a position that reach the same nim-value
+    are shown as one, labelled with how many moves it stands for, since
+    only the set of values reached decides the position's own value.
+    The count is kept per parent; a position reached from several parents
+    has each count by its line instead."""
+    max_width = max( x for (x,y) in shape.coords ) + 1
+    max_height = max( y for (x,y) in shape.coords ) + 1
+    x_spacing = (max_width + 2) * 10
+    y_spacing = (max_height + 8) * 10
+    min_x = -( (maxNodes + 1) * x_spacing ) / 2
+
+    out.write( '<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+               'viewBox="{} {} {} {}">\n'.format(
+                   min_x, -x_spacing, -2 * min_x + x_spacing,
+                   (maxLevels + 1) * y_spacing ) )
+    d = _Stream( out )
+
+    value = solve_position( shape, values, cache )
+    drawRegion( d, shape.coords, 0, 0 )
+    _drawText( d, 0 if value == 0 else "*" + str( value ),
+               max_width * 5, max_height * 10 + 10 )
+    anchors = [ (max_width * 5, max_height * 10 + 20) ]
+    shapes = [ shape ]
+    plain = _plainCache( cache )
+
+    for i in range( 1, maxLevels ):
+        nextLevel = {}
+        counts = {}
+        for j, s in enumerate( shapes ):
+            if s is None:
+                continue
+            reached = {}
+            for key, p in _moves( s, j, values, cache, plain ):
+                if collapse:
+                    total = nim_addition( *p.values ) if len( p.values ) > 0 else 0
+                    if total in reached:
+                        counts[( j, reached[total] )] += 1
+                        continue
+                    reached[total] = key
+                if key in nextLevel:
+                    nextLevel[key].parent.append( j )
+                else:
+                    nextLevel[key] = p
+                counts[( j, key )] = 1
+        if len( nextLevel ) == 0:
+            break
+
+        level = list( nextLevel.items() )
+        hidden = len( level ) - maxNodes
+        level = level[:maxNodes]
+        x_start = -(len( level ) * x_spacing) / 2
+        y_start = y_spacing * i
+        nextAnchors = []
+        shapes = []
+        for j, (key, p) in enumerate( level ):
+            x = x_start + j * x_spacing
+            label = _label( p.values )
+            if len( p.parent ) == 1 and counts[( p.parent[0], key )] > 1:
+                label += " (x{})".format( counts[( p.parent[0], key )] )
+            _drawPosition( d, p, x, y_start, max_width, max_height, label )
+            for parent_index in p.parent:
+                top = (x + max_width * 5, y_start - 10)
+                d.add( d.line( top, anchors[parent_index], stroke="black" ) )
+                n = counts[( parent_index, key )]
+                if len( p.parent ) > 1 and n > 1:
+                    _drawText( d, "x{}".format( n ),
+                               ( top[0] * 3 + anchors[parent_index][0] ) / 4,
+                               ( top[1] * 3 + anchors[parent_index][1] ) / 4 )
+            nextAnchors.append( (x + max_width * 5,
+                                 y_start + max_height * 10 + 20) )
+            shapes.append( Shape.fromKey( p.keys[0] )
+                           if len( p.partitions ) == 1 else None )
+        if hidden > 0:
+            _drawText( d, "+{} more".format( hidden ),
+                       x_start + len( level ) * x_spacing + max_width * 5,
+                       y_start + max_height * 5 )
+        anchors = nextAnchors
+
+    out.write( "</svg>\n" )
 
 def colorDemo():
     d = svgwrite.Drawing()
@@ -0,0 +1,115 @@
+"""A table of nim-values with a memory budget."""
+import itertools
+import sys
+
+from grid.canonical import cells
+
+# Rough cost of a dict entry besides its key: the slot in the hash table
+# and its share of the free space kept for growth.
+ENTRY_BYTES = 48
+
+class TranspositionTable(object):
+    """A table of nim-values keyed by canonical Shape.key() that can be
+    passed to the solvers in place of a dict, holding roughly `budget`
+    bytes at most.
+
+    When the table is full, positions are evicted a batch at a time
+    starting with those with the fewest squares, since they are the
+    cheapest to solve again.  Positions of at most pinCells squares are
+    never evicted; they are the bulk of every lookup and a table that
+    cannot hold them is too small anyway."""
+
+    def __init__( self, budget = 1 << 30, pinCells = 16, lowWater = 0.9 ):
+        self.budget = budget
+        self.pinCells = pinCells
+        self.lowWater = lowWater
+        # Number of squares -> { key : value } in order of insertion
+        self.buckets = {}
+        self.count = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _cost( self, key ):
+        return sys.getsizeof( key ) + ENTRY_BYTES
+
+    def __contains__( self, key ):
+        bucket = self.buckets.get( cells( key ) )
+        if bucket is not None and key in bucket:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def __getitem__( self, key ):
+        bucket = self.buckets.get( cells( key ) )
+        if bucket is None:
+            raise KeyError( key )
+        return bucket[key]
+
+    def get( self, key, default = None ):
+        bucket = self.buckets.get( cells( key ) )
+        if bucket is not None and key in bucket:
+            self.hits += 1
+            return bucket[key]
+        self.misses += 1
+        return default
+
+    def __setitem__( self, key, value ):
+        n = cells( key )
+        bucket = self.buckets.get( n )
+        if bucket is None:
+            bucket = self.buckets[n] = {}
+        elif key in bucket:
+            bucket[key] = value
+            return
+        cost = self._cost( key )
+        if self.bytes + cost > self.budget:
+            self._evict()
+            # _evict may have replaced the bucket
+            bucket = self.buckets.setdefault( n, {} )
+        bucket[key] = value
+        self.count += 1
+        self.bytes += cost
+
+    def _evict( self ):
+        target = self.budget * self.lowWater
+        for n in sorted( self.buckets ):
+            if self.bytes <= target:
+                break
+            if n <= self.pinCells:
+                continue
+            bucket = self.buckets[n]
+            dropped = 0
+            for key in bucket:
+                if self.bytes <= target:
+                    break
+                self.bytes -= self._cost( key )
+                dropped += 1
+            # Deleting from the front of a dict one key at a time leaves
+            # it slow to iterate, so copy the survivors instead.
+            self.buckets[n] = dict( itertools.islice( bucket.items(),
+                                                      dropped, None ) )
+            self.count -= dropped
+            self.evictions += dropped
+
+    def __len__( self ):
+        return self.count
+
+    def items( self ):
+        for bucket in self.buckets.values():
+            yield from bucket.items()
+
+    def update( self, other ):
+        for key, value in other.items():
+            self[key] = value
+
+    def footprint( self ):
+        """Estimated bytes held by the table's entries."""
+        return self.bytes
+
+    def stats( self ):
+        return "{} positions, {:.1f} MB, {} hits, {} misses, {} evictions".format(
+            self.count, self.bytes / ( 1 << 20 ), self.hits, self.misses,
+            self.evictions )
@@ -0,0 +1,167 @@
+"""A compact file format for tables of nim-values.
+
+The file holds one section per key length.  Each section is an array of
+fixed-size records, a canonical Shape.key() in little-endian bytes
+followed by its nim-value in one byte, sorted by key so that a single
+shape can be found by binary search without reading the rest.
+
+    header   magic b"DCNV", version, value bytes, number of sections
+    sections key bytes, record count, offset of first record
+    records  key, value
+
+parseResults reads the ASCII dumps in results/*.txt.
+"""
+import bisect
+import mmap
+import struct
+
+from grid import Shape
+
+MAGIC = b"DCNV"
+VERSION = 1
+HEADER = struct.Struct( "<4sBBH" )
+SECTION = struct.Struct( "<HIQ" )
+
+def _keyBytes( key ):
+    return max( 1, ( key.bit_length() + 7 ) // 8 )
+
+def save( values, path ):
+    """Write a table of nim-values keyed by Shape.key()."""
+    sections = {}
+    for key, value in values.items():
+        assert 0 <= value < 256
+        sections.setdefault( _keyBytes( key ), [] ).append( ( key, value ) )
+
+    offset = HEADER.size + SECTION.size * len( sections )
+    table = []
+    for size in sorted( sections ):
+        table.append( ( size, len( sections[size] ), offset ) )
+        offset += ( size + 1 ) * len( sections[size] )
+
+    with open( path, "wb" ) as f:
+        f.write( HEADER.pack( MAGIC, VERSION, 1, len( sections ) ) )
+        for entry in table:
+            f.write( SECTION.pack( *entry ) )
+        for size in sorted( sections ):
+            records = sorted( sections[size] )
+            f.write( b"".join( key.to_bytes( size, "little" ) + bytes( [value] )
+                               for key, value in records ) )
+
+class _Records(object):
+    """The keys of one section, as a sequence for bisect."""
+    def __init__( self, data, size, count, offset ):
+        self.data = data
+        self.size = size
+        self.count = count
+        self.offset = offset
+
+    def __len__( self ):
+        return self.count
+
+    def __getitem__( self, i ):
+        start = self.offset + i * ( self.size + 1 )
+        return int.from_bytes( self.data[start:start + self.size], "little" )
+
+    def value( self, i ):
+        return self.data[self.offset + i * ( self.size + 1 ) + self.size]
+
+class TableFile(object):
+    """Read-only, memory-mapped access to a saved table, usable in place
+    of the values dict for lookups."""
+    def __init__( self, path ):
+        self.file = open( path, "rb" )
+        self.data = mmap.mmap( self.file.fileno(), 0, access = mmap.ACCESS_READ )
+        magic, version, valueBytes, count = HEADER.unpack_from( self.data, 0 )
+        if magic != MAGIC or version != VERSION or valueBytes != 1:
+            raise ValueError( "{} is not a nim-value table".format( path ) )
+        self.sections = {}
+        for i in range( count ):
+            size, records, offset = SECTION.unpack_from(
+                self.data, HEADER.size + i * SECTION.size )
+            self.sections[size] = _Records( self.data, size, records, offset )
+
+    def _find( self, key ):
+        records = self.sections.get( _keyBytes( key ) )
+        if records is None:
+            return None, None
+        i = bisect.bisect_left( records, key )
+        if i == len( records ) or records[i] != key:
+            return None, None
+        return records, i
+
+    def __contains__( self, key ):
+        return self._find( key )[0] is not None
+
+    def __getitem__( self, key ):
+        records, i = self._find( key )
+        if records is None:
+            raise KeyError( key )
+        return records.value( i )
+
+    def get( self, key, default = None ):
+        records, i = self._find( key )
+        if records is None:
+            return default
+        return records.value( i )
+
+    def __len__( self ):
+        return sum( len( r ) for r in self.sections.values() )
+
+    def items( self ):
+        for records in self.sections.values():
+            for i in range( len( records ) ):
+                yield records[i], records.value( i )
+
+    def close( self ):
+        self.data.close()
+        self.file.close()
+
+def load( path ):
+    """Read a whole saved table into a dict."""
+    table = TableFile( path )
+    values = dict( table.items() )
+    table.close()
+    return values
+
+def parseResults( path ):
+    """Read the positions and nim-values from an ASCII dump like those in
+    results/, keyed by canonical Shape.key()."""
+    values = {}
+    picture = []
+    last = None
+    with open( path ) as f:
+        for line in f:
+            line = line.rstrip( "\n" )
+            if line.startswith( "-" ) and line.strip( "-" ) == "":
+                # A rule ends one picture and starts the next
+                last = picture
+                picture = []
+            elif line.startswith( "has nim-value" ) and last:
+                coords = [ (x,y) for y, row in enumerate( last )
+                           for x, c in enumerate( row ) if c == "#" ]
+                values[Shape( coords ).canonical().key()] = int( line.split()[-1] )
+                last = None
+            else:
+                picture.append( line )
+    return values
+
+def warm( paths ):
+    """Load saved tables and ASCII dumps into one dict."""
+    values = {}
+    for path in paths:
+        if path.endswith( ".txt" ):
+            values.update( parseResults( path ) )
+        else:
+            values.update( load( path ) )
+    return values
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description = "Convert results/*.txt dumps to a nim-value table." )
+    parser.add_argument( "inputs", nargs = "+" )
+    parser.add_argument( "-o", "--output", required = True )
+    args = parser.parse_args()
+    values = warm( args.inputs )
+    save( values, args.output )
+    print( "wrote", len( values ), "positions to", args.output )
@@ -0,0 +1,75 @@
+"""Bitboard encoding of a set of grid squares.
+
+A region is a single integer.  Square (x,y), measured from an origin
+(x0,y0), is bit (y-y0) * stride + (x-x0).  The stride is always at least
+one more than the width of the region, so the last column of every row
+stays empty and shifting a board by one square left or right can never
+carry a square into the neighbouring row.
+"""
+
+def pack( coords ):
+    """Return (bits, stride, x0, y0) for a collection of (x,y) squares."""
+    coords = list( coords )
+    if len( coords ) == 0:
+        return 0, 1, 0, 0
+    x0 = min( x for (x,y) in coords )
+    y0 = min( y for (x,y) in coords )
+    stride = max( x for (x,y) in coords ) - x0 + 2
+    bits = 0
+    for (x,y) in coords:
+        bits |= 1 << ( (y - y0) * stride + x - x0 )
+    return bits, stride, x0, y0
+
+def squares( bits ):
+    """Yield the index of every set bit, lowest first."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+def unpack( bits, stride, x0 = 0, y0 = 0 ):
+    """List the (x,y) squares set in a bitboard."""
+    return [ (x0 + i % stride, y0 + i // stride) for i in squares( bits ) ]
+
+def columns( bits, stride ):
+    """OR together every row of the bitboard."""
+    row = ( 1 << stride ) - 1
+    acc = 0
+    while bits:
+        acc |= bits & row
+        bits >>= stride
+    return acc
+
+def extent( bits, stride ):
+    """Return (minX, minY, width, height) of the squares in the bitboard,
+    relative to its origin."""
+    if bits == 0:
+        return 0, 0, 0, 0
+    cols = columns( bits, stride )
+    minX = ( cols & -cols ).bit_length() - 1
+    minY = ( ( bits & -bits ).bit_length() - 1 ) // stride
+    maxY = ( bits.bit_length() - 1 ) // stride
+    return minX, minY, cols.bit_length() - minX, maxY - minY + 1
+
+def restride( bits, stride, newStride, height ):
+    """Re-encode the first height rows of a bitboard with a different
+    stride.  Every row must fit within the new stride."""
+    if stride == newStride:
+        return bits
+    row = ( 1 << stride ) - 1
+    out = 0
+    for y in range( height ):
+        out |= ( ( bits >> ( y * stride ) ) & row ) << ( y * newStride )
+    return out
+
+def normalize( bits, stride ):
+    """Move the squares so the leftmost column and first row are both 0,
+    and tighten the stride to the width plus one.
+
+    Returns (bits, stride, dx, dy) where (dx,dy) is how far the origin
+    moved."""
+    if bits == 0:
+        return 0, 1, 0, 0
+    minX, minY, width, height = extent( bits, stride )
+    bits >>= minY * stride + minX
+    return restride( bits, stride, width + 1, height ), width + 1, minX, minY
@@ -0,0 +1,24 @@
+"""Build the optional C kernel, grid._kernel, with cffi.
+
+    python -m grid.build_kernel
+
+grid.canonical and doublecram.splitRegions use the kernel when it has
+been built and fall back to Python otherwise; see grid/native.py.
+"""
+import os
+from cffi import FFI
+
+HERE = os.path.dirname( os.path.abspath( __file__ ) )
+
+ffibuilder = FFI()
+ffibuilder.cdef( """
+    int canonical_key( uint64_t lo, uint64_t hi, int stride, uint64_t *out );
+    int split_regions( uint64_t lo, uint64_t hi, int stride,
+                       uint64_t moveLo, uint64_t moveHi, uint64_t *out );
+""" )
+with open( os.path.join( HERE, "kernel.c" ) ) as f:
+    ffibuilder.set_source( "grid._kernel", f.read(),
+                           extra_compile_args = [ "-O2" ] )
+
+if __name__ == "__main__":
+    ffibuilder.compile( tmpdir = os.path.dirname( HERE ) )
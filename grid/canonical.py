@@ -0,0 +1,196 @@
+"""Canonical keys for shapes under the symmetries of the square.
+
+A key packs a normalized bitboard (see grid.bitboard) together with its
+width, as bits << WIDTH_BITS | width where the bitboard has stride
+width + 1.  The canonical key of a shape is the smallest key among its
+eight images under rotation and reflection, considering only images that
+are at least as tall as they are wide.  A shape whose bounding box is
+not square therefore only has four candidate images.
+
+The images are compared a row at a time starting from the most
+significant, and an image is dropped as soon as it is worse than the
+best so far, so most shapes are decided by their first row.
+"""
+from functools import lru_cache
+from grid import native
+from grid.bitboard import normalize
+
+if native.lib is not None:
+    _out = native.ffi.new( "uint64_t[3]" )
+
+WIDTH_BITS = 8
+
+# Rows at most this wide use lookup tables; wider rows are computed.
+TABLE_WIDTH = 12
+
+def packKey( bits, width ):
+    assert width < ( 1 << WIDTH_BITS )
+    return ( bits << WIDTH_BITS ) | width
+
+def unpackKey( key ):
+    """Return (bits, stride) of the bitboard in a key."""
+    width = key & ( ( 1 << WIDTH_BITS ) - 1 )
+    return key >> WIDTH_BITS, width + 1
+
+def cells( key ):
+    """Number of squares in the shape with the given key."""
+    return bin( key >> WIDTH_BITS ).count( "1" )
+
+class _Mirror(object):
+    """Row mirroring for rows too wide for a table."""
+    def __init__( self, width ):
+        self.width = width
+
+    def __getitem__( self, row ):
+        return int( format( row, "0{}b".format( self.width ) )[::-1], 2 )
+
+@lru_cache( maxsize = None )
+def mirrorTable( width ):
+    """Map each row of the given width to its mirror image."""
+    if width > TABLE_WIDTH:
+        return _Mirror( width )
+    table = [0] * ( 1 << width )
+    for row in range( 1, 1 << width ):
+        table[row] = ( table[row >> 1] >> 1 ) | ( ( row & 1 ) << ( width - 1 ) )
+    return table
+
+@lru_cache( maxsize = None )
+def transposeTable( width, height ):
+    """Map each row of the given width to the bits it sets in the first
+    column of the transposed bitboard, which has stride height + 1."""
+    stride = height + 1
+    if width > TABLE_WIDTH:
+        return None
+    table = [0] * ( 1 << width )
+    for row in range( 1, 1 << width ):
+        low = row & -row
+        table[row] = table[row ^ low] | ( 1 << ( ( low.bit_length() - 1 ) * stride ) )
+    return table
+
+def rowsOf( bits, stride, height ):
+    """List the rows of a bitboard, first row first."""
+    mask = ( 1 << ( stride - 1 ) ) - 1
+    return [ ( bits >> ( y * stride ) ) & mask for y in range( height ) ]
+
+def transpose( rows, width ):
+    """Swap x and y in a list of rows."""
+    height = len( rows )
+    table = transposeTable( width, height )
+    bits = 0
+    if table is None:
+        for y, row in enumerate( rows ):
+            for x in range( width ):
+                if ( row >> x ) & 1:
+                    bits |= 1 << ( x * ( height + 1 ) + y )
+    else:
+        for y, row in enumerate( rows ):
+            bits |= table[row] << y
+    return rowsOf( bits, height + 1, width )
+
+def images( bits, stride ):
+    """Normalize a bitboard and list its candidate images.
+
+    Returns (width, height, candidates) where width and height are those
+    of the images and each candidate is (rows, mirror).  rows lists the
+    rows of the image from the most significant down, and mirror is a
+    table to apply to every row, or None."""
+    bits, stride, _, _ = normalize( bits, stride )
+    width = stride - 1
+    height = ( bits.bit_length() + width ) // stride
+    rows = rowsOf( bits, stride, height )
+    candidates = []
+    if width <= height:
+        mirror = mirrorTable( width )
+        top = rows[::-1]
+        candidates += [ (top, None), (rows, None),
+                        (top, mirror), (rows, mirror) ]
+    if width >= height:
+        cols = transpose( rows, width )
+        mirror = mirrorTable( height )
+        top = cols[::-1]
+        candidates += [ (top, None), (cols, None),
+                        (top, mirror), (cols, mirror) ]
+    return min( width, height ), max( width, height ), candidates
+
+def canonicalKey( bits, stride ):
+    """Return the canonical key of the squares in a bitboard."""
+    if bits == 0:
+        return packKey( 0, 0 )
+    if native.enabled and bits.bit_length() <= 128 and \
+       native.lib.canonical_key( bits & native.MASK64, bits >> 64, stride, _out ):
+        return ( ( ( _out[1] << 64 ) | _out[0] ) << WIDTH_BITS ) | _out[2]
+    return _canonicalKey( bits, stride )
+
+def _canonicalKey( bits, stride ):
+    width, height, alive = images( bits, stride )
+    for k in range( height ):
+        if len( alive ) == 1:
+            break
+        best = None
+        survivors = []
+        for c in alive:
+            rows, mirror = c
+            row = rows[k] if mirror is None else mirror[rows[k]]
+            if best is None or row < best:
+                best = row
+                survivors = [c]
+            elif row == best:
+                survivors.append( c )
+        alive = survivors
+
+    rows, mirror = alive[0]
+    stride = width + 1
+    bits = 0
+    for row in rows:
+        bits = ( bits << stride ) | ( row if mirror is None else mirror[row] )
+    return packKey( bits, width )
+
+def identityKey( bits, stride ):
+    """Return the key of the bitboard without applying any symmetry."""
+    bits, stride, _, _ = normalize( bits, stride )
+    return packKey( bits, stride - 1 )
+
+def symmetries( bits, stride ):
+    """List the symmetries of the square that map the shape in a bitboard
+    onto itself, always starting with the identity.
+
+    Each is a function from (x,y) to (x,y) in the coordinates of the
+    shape shifted to zero."""
+    if bits == 0:
+        return [ _symmetry( False, False, False, 0, 0 ) ]
+    bits, stride, _, _ = normalize( bits, stride )
+    width = stride - 1
+    height = ( bits.bit_length() + width ) // stride
+    rows = rowsOf( bits, stride, height )
+    mirror = mirrorTable( width )
+
+    # Cheap tests first: most shapes fail on their first or last row.
+    found = []
+    for swap in ( (False, True) if width == height else (False,) ):
+        image = transpose( rows, width ) if swap else rows
+        for flipY in ( False, True ):
+            flipped = image[::-1] if flipY else image
+            for flipX in ( False, True ):
+                if flipX:
+                    if mirror[flipped[0]] != rows[0] or \
+                       mirror[flipped[-1]] != rows[-1]:
+                        continue
+                    flipped = [ mirror[r] for r in flipped ]
+                elif flipped[0] != rows[0] or flipped[-1] != rows[-1]:
+                    continue
+                if flipped == rows:
+                    found.append( _symmetry( swap, flipX, flipY,
+                                             width, height ) )
+    return found
+
+def _symmetry( swap, flipX, flipY, width, height ):
+    def apply( point ):
+        x, y = point
+        if swap:
+            x, y = y, x
+        if flipX:
+            x = width - 1 - x
+        if flipY:
+            y = height - 1 - y
+        return x, y
+    return apply
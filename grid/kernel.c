@@ -0,0 +1,192 @@
+/* Bitboard kernels for grid.canonical and doublecram.splitRegions; see
+ * grid/build_kernel.py.
+ *
+ * Bitboards of up to 128 bits are passed as two 64-bit halves.  The
+ * functions return 0 if the board does not fit, in which case the caller
+ * falls back to Python.
+ */
+#include <stdint.h>
+
+typedef unsigned __int128 u128;
+
+#define MAX_ROWS 64
+#define MAX_GROUPS 16
+
+static uint64_t mirror( uint64_t row, int width )
+{
+    uint64_t out = 0;
+    for ( int x = 0; x < width; x++ ) {
+        if ( row & ( (uint64_t)1 << x ) ) {
+            out |= (uint64_t)1 << ( width - 1 - x );
+        }
+    }
+    return out;
+}
+
+/* Smallest key of the four images of rows under reversing the order of
+ * the rows and mirroring each row. */
+static u128 smallest( const uint64_t *rows, int width, int height )
+{
+    uint64_t flipped[MAX_ROWS];
+    for ( int y = 0; y < height; y++ ) {
+        flipped[y] = mirror( rows[y], width );
+    }
+    u128 best = 0;
+    int first = 1;
+    for ( int m = 0; m < 2; m++ ) {
+        const uint64_t *r = m ? flipped : rows;
+        for ( int reverse = 0; reverse < 2; reverse++ ) {
+            u128 bits = 0;
+            for ( int k = 0; k < height; k++ ) {
+                int y = reverse ? height - 1 - k : k;
+                bits = ( bits << ( width + 1 ) ) | r[y];
+            }
+            if ( first || bits < best ) {
+                best = bits;
+                first = 0;
+            }
+        }
+    }
+    return best;
+}
+
+int canonical_key( uint64_t lo, uint64_t hi, int stride, uint64_t *out )
+{
+    u128 bits = ( (u128)hi << 64 ) | lo;
+    if ( bits == 0 || stride > 64 ) {
+        return 0;
+    }
+    uint64_t mask = stride == 64 ? ~(uint64_t)0 : ( (uint64_t)1 << stride ) - 1;
+    uint64_t rows[MAX_ROWS];
+    int height = 0;
+    int minY = -1;
+    uint64_t used = 0;
+    for ( int y = 0; bits != 0; y++ ) {
+        uint64_t row = (uint64_t)bits & mask;
+        bits >>= stride;
+        if ( row == 0 && minY < 0 ) {
+            continue;
+        }
+        if ( minY < 0 ) {
+            minY = y;
+        }
+        if ( y - minY >= MAX_ROWS ) {
+            return 0;
+        }
+        rows[y - minY] = row;
+        height = y - minY + 1;
+        used |= row;
+    }
+    int minX = __builtin_ctzll( used );
+    int width = 64 - __builtin_clzll( used ) - minX;
+    for ( int y = 0; y < height; y++ ) {
+        rows[y] >>= minX;
+    }
+    int small = width < height ? width : height;
+    int large = width < height ? height : width;
+    if ( large * ( small + 1 ) > 128 || large > MAX_ROWS ) {
+        return 0;
+    }
+
+    u128 best = 0;
+    int first = 1;
+    if ( width <= height ) {
+        best = smallest( rows, width, height );
+        first = 0;
+    }
+    if ( width >= height ) {
+        uint64_t columns[MAX_ROWS] = { 0 };
+        for ( int x = 0; x < width; x++ ) {
+            uint64_t c = 0;
+            for ( int y = 0; y < height; y++ ) {
+                c |= ( ( rows[y] >> x ) & 1 ) << y;
+            }
+            columns[x] = c;
+        }
+        u128 t = smallest( columns, height, width );
+        if ( first || t < best ) {
+            best = t;
+        }
+    }
+    out[0] = (uint64_t)best;
+    out[1] = (uint64_t)( best >> 64 );
+    out[2] = small;
+    return 1;
+}
+
+static u128 touch( u128 moves, int stride )
+{
+    u128 rows = moves | ( moves << 1 ) | ( moves >> 1 );
+    return rows | ( rows << stride ) | ( rows >> stride );
+}
+
+static u128 cover( u128 moves, int stride )
+{
+    return moves | ( moves << 1 ) | ( moves << stride ) | ( moves << ( stride + 1 ) );
+}
+
+static u128 grow( u128 region, u128 within, int stride )
+{
+    for ( ;; ) {
+        u128 grown = touch( region, stride ) & within;
+        if ( grown == region ) {
+            return region;
+        }
+        region = grown;
+    }
+}
+
+static u128 lowest( u128 bits )
+{
+    return bits & ( ~bits + 1 );
+}
+
+/* The same as doublecram.splitMove followed by coverMask: writes the
+ * squares of each region left in moves after playing move, as pairs of
+ * halves in the order of their lowest bits, and returns the number of
+ * regions, or -1 if there are more than MAX_GROUPS. */
+int split_regions( uint64_t lo, uint64_t hi, int stride,
+                   uint64_t moveLo, uint64_t moveHi, uint64_t *out )
+{
+    u128 moves = ( (u128)hi << 64 ) | lo;
+    u128 move = ( (u128)moveHi << 64 ) | moveLo;
+    u128 removed = touch( move, stride ) & moves;
+    u128 remaining = moves & ~removed;
+    u128 seeds = touch( removed, stride ) & remaining;
+    if ( seeds == 0 ) {
+        return 0;
+    }
+
+    u128 groups[MAX_GROUPS];
+    int count = 0;
+    u128 window = touch( touch( removed, stride ), stride ) & remaining;
+    if ( ( seeds & ~grow( lowest( seeds ), window, stride ) ) == 0 ) {
+        groups[count++] = remaining;
+    } else {
+        while ( seeds != 0 ) {
+            if ( count == MAX_GROUPS ) {
+                return -1;
+            }
+            u128 region = grow( lowest( seeds ), remaining, stride );
+            groups[count++] = region;
+            seeds &= ~region;
+        }
+    }
+
+    /* Insertion sort by lowest bit; there are only a handful. */
+    for ( int i = 1; i < count; i++ ) {
+        u128 g = groups[i];
+        int j = i;
+        while ( j > 0 && lowest( groups[j - 1] ) > lowest( g ) ) {
+            groups[j] = groups[j - 1];
+            j--;
+        }
+        groups[j] = g;
+    }
+    for ( int i = 0; i < count; i++ ) {
+        u128 c = cover( groups[i], stride );
+        out[2 * i] = (uint64_t)c;
+        out[2 * i + 1] = (uint64_t)( c >> 64 );
+    }
+    return count;
+}
@@ -0,0 +1,21 @@
+"""The optional C kernel, grid._kernel, built by grid/build_kernel.py.
+
+When it has not been built, or after setNative( False ), every caller
+uses its Python code instead.
+"""
+try:
+    from grid._kernel import ffi, lib
+except ImportError:
+    ffi = None
+    lib = None
+
+MASK64 = ( 1 << 64 ) - 1
+
+enabled = lib is not None
+
+def setNative( on ):
+    """Choose whether to use the kernel, if it is built.  Returns whether
+    it will be used."""
+    global enabled
+    enabled = bool( on ) and lib is not None
+    return enabled
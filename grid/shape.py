@@ -1,23 +1,62 @@
+from grid import bitboard
+from grid.canonical import canonicalKey, identityKey, packKey, unpackKey, symmetries
+from grid.canonical import mirrorTable, transpose
 
 class Shape(object):
     def __init__( self, coords = None ):
-        # X,Y coordinates in the shape
+        # X,Y coordinates in the shape, packed into a bitboard; see
+        # grid.bitboard for the layout.
         if coords is None:
-            self.coords = []
-        else:
-            self.coords = list( coords )
-        
+            coords = []
+        self.bits, self.stride, self.x0, self.y0 = bitboard.pack( coords )
+        self._coords = None
+        self._key = None
+        self._symmetries = None
+
+    def __getstate__( self ):
+        # The symmetries are closures, which cannot be pickled; they are
+        # found again when needed.
+        state = self.__dict__.copy()
+        state["_symmetries"] = None
+        return state
+
+    @classmethod
+    def fromBits( cls, bits, stride, x0 = 0, y0 = 0 ):
+        """Wrap an existing bitboard without unpacking it."""
+        s = cls.__new__( cls )
+        s.bits = bits
+        s.stride = stride
+        s.x0 = x0
+        s.y0 = y0
+        s._coords = None
+        s._key = None
+        s._symmetries = None
+        return s
+
+    @classmethod
+    def fromKey( cls, key ):
+        """Rebuild a shape, shifted to zero, from its key()."""
+        bits, stride = unpackKey( key )
+        s = cls.fromBits( bits, stride )
+        s._key = key
+        return s
+
+    @property
+    def coords( self ):
+        """List of X,Y coordinates in the shape, sorted by x and then y."""
+        if self._coords is None:
+            self._coords = sorted( bitboard.unpack( self.bits, self.stride,
+                                                    self.x0, self.y0 ) )
+        return self._coords
+
     def shiftToZero( self ):
         """Move the shape so that the leftmost and bottommost coordinates are
         both 0."""
-        if len( self.coords ) == 0:
-            return
-        minX = min( x for (x,y) in self.coords )
-        minY = min( y for (x,y) in self.coords )
-        self.coords = [ (x-minX, y-minY) for (x,y) in self.coords]
-        self.coords.sort()
-        assert self.coords[0][0] >= 0
-        assert self.coords[0][1] >= 0
+        self.bits, self.stride, _, _ = bitboard.normalize( self.bits,
+                                                           self.stride )
+        self.x0 = 0
+        self.y0 = 0
+        self._coords = None
 
     def compare( self, other ):
         """Compare lexicographic order of coordinates, which are
@@ -91,28 +130,31 @@ class Shape(object):
         return s
 
     def key( self ):
-        return tuple( self.coords )
+        """Packed encoding of the shape, independent of its position."""
+        if self._key is None:
+            self._key = identityKey( self.bits, self.stride )
+        return self._key
 
     def canonical( self ):
-        """Return the lexicographically smallest of the shape under
-        the symmetries of the square"""
-        identity = Shape( self.coords )
-        identity.shiftToZero()
-        return min( identity,
-                    self.rotate90(),
-                    self.rotate180(),
-                    self.rotate270(),
-                    self.flipVertical(),
-                    self.flipHorizontal(),
-                    self.flipAscendingDiagonal(),
-                    self.flipDescendingDiagonal(),
-                    key = lambda x : x.key() )
+        """Return the shape with the smallest key under the symmetries of
+        the square; see grid.canonical."""
+        return Shape.fromKey( canonicalKey( self.bits, self.stride ) )
+    
+    def symmetries( self ):
+        """List the symmetries of the square that leave the shape unchanged,
+        starting with the identity.  Each maps an (x,y) coordinate of the
+        shape shifted to zero to the one it is carried to."""
+        if self._symmetries is None:
+            self._symmetries = symmetries( self.bits, self.stride )
+        return self._symmetries
     
     def height( self ):
-        return max( y for (x,y) in self.coords ) + 1
+        _, minY, _, h = bitboard.extent( self.bits, self.stride )
+        return self.y0 + minY + h
 
     def width( self ):
-        return max( x for (x,y) in self.coords ) + 1
+        minX, _, w, _ = bitboard.extent( self.bits, self.stride )
+        return self.x0 + minX + w
     
     def plot( self, w = None, h = None ):
         if h is None:
@@ -126,17 +168,114 @@ class Shape(object):
 
 import itertools
 
-def enumerate( n ):
-    result = set()
-    all_coords = [ (x,y) for x in range( n ) for y in range( n ) ]
-    for pop in range( 1, n * n + 1 ):
-        for c in itertools.combinations( all_coords, r=pop ):
-            s = Shape( c ).canonical()
-            k = s.key()
-            if k not in result:
-                result.add( k )
-                yield s
-                
+def enumerate( n, connected = False, trimmed = False ):
+    """Generate each canonical shape that fits in an n x n square once.
+
+    With trimmed, only shapes that are unions of 2x2 blocks, as
+    trimShape leaves them; with connected, only shapes in one piece,
+    which for trimmed shapes means one region of overlapping blocks as
+    decompose returns them, and otherwise squares joined edge to edge.
+    Shapes come in no particular order."""
+    if connected or trimmed:
+        return _grow( n, connected, trimmed )
+    return _orderly( n )
+
+def _orderly( n ):
+    # Build each w x h box a row at a time, most significant row first,
+    # skipping first and last rows that could not start the smallest
+    # image, and keep the shapes that are no larger than any image.
+    for h in range( 1, n + 1 ):
+        for w in range( 1, h + 1 ):
+            mirror = mirrorTable( w )
+            edges = 1 | ( 1 << ( w - 1 ) )
+            for first in range( 1, 1 << w ):
+                if mirror[first] < first:
+                    continue
+                for last in ( range( first, 1 << w ) if h > 1 else [ first ] ):
+                    if mirror[last] < first:
+                        continue
+                    for middle in itertools.product( range( 1 << w ),
+                                                     repeat = max( 0, h - 2 ) ):
+                        rows = [ first, *middle, last ] if h > 1 else [ first ]
+                        used = 0
+                        for r in rows:
+                            used |= r
+                        if used & edges != edges or \
+                           not _smallest( rows, w, h, mirror ):
+                            continue
+                        bits = 0
+                        for r in rows:
+                            bits = ( bits << ( w + 1 ) ) | r
+                        yield Shape.fromKey( packKey( bits, w ) )
+
+def _smallest( rows, w, h, mirror ):
+    """Are rows no larger than any of their images under the symmetries
+    of the square that keep the width and height?"""
+    flipped = [ mirror[r] for r in rows ]
+    images = [ rows[::-1], flipped, flipped[::-1] ]
+    if w == h:
+        cols = transpose( rows, w )
+        flipped = [ mirror[r] for r in cols ]
+        images += [ cols, cols[::-1], flipped, flipped[::-1] ]
+    for image in images:
+        if image < rows:
+            return False
+    return True
+
+def _grow( n, connected, trimmed ):
+    # Grow shapes from a single square or 2x2 block by adding another,
+    # placing each shape found at every position in an n x n frame.
+    stride = n + 1
+    frame = 0
+    for y in range( n ):
+        frame |= ( ( 1 << n ) - 1 ) << ( y * stride )
+    blocks = frame & ( frame >> 1 ) & ( frame >> stride ) & ( frame >> ( stride + 1 ) )
+    if trimmed:
+        if n < 2:
+            return
+        seed = 1 | 2 | ( 1 << stride ) | ( 1 << ( stride + 1 ) )
+    else:
+        seed = 1
+    level = [ canonicalKey( seed, stride ) ]
+    seen = set( level )
+    while len( level ) > 0:
+        nextLevel = []
+        for key in level:
+            yield Shape.fromKey( key )
+            bits, keyStride = unpackKey( key )
+            w = keyStride - 1
+            h = ( bits.bit_length() + w ) // keyStride
+            bits = bitboard.restride( bits, keyStride, stride, h )
+            for dy in range( n - h + 1 ):
+                for dx in range( n - w + 1 ):
+                    placed = bits << ( dy * stride + dx )
+                    for added in _additions( placed, stride, frame, blocks,
+                                             connected, trimmed ):
+                        k = canonicalKey( placed | added, stride )
+                        if k not in seen:
+                            seen.add( k )
+                            nextLevel.append( k )
+        level = nextLevel
+
+def _additions( bits, stride, frame, blocks, connected, trimmed ):
+    """List the squares or blocks that could be added to bits."""
+    if trimmed:
+        moves = bits & ( bits >> 1 ) & ( bits >> stride ) & ( bits >> ( stride + 1 ) )
+        if connected:
+            near = moves | ( moves << 1 ) | ( moves >> 1 )
+            candidates = ( near | ( near << stride ) | ( near >> stride ) ) & blocks
+        else:
+            candidates = blocks
+        candidates &= ~moves
+        return [ b | ( b << 1 ) | ( b << stride ) | ( b << ( stride + 1 ) )
+                 for b in map( lambda i : 1 << i, bitboard.squares( candidates ) ) ]
+    if connected:
+        candidates = ( bits << 1 ) | ( bits >> 1 ) | ( bits << stride ) | ( bits >> stride )
+    else:
+        candidates = frame
+    candidates &= frame & ~bits
+    return [ 1 << i for i in bitboard.squares( candidates ) ]
+
 def plot_text( collection, n = 10 ):
     for s in collection:
         print( "-" * n )
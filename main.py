@@ -1,33 +1,181 @@
-from doublecram.solve import solve_square
-from doublecram.doublecram import validMoves, makeMove
+from doublecram.solve import solve_square, solve_position, solve_outcome, is_loss
+from doublecram.solve import verify_reduction, SUMS
+from doublecram.cache import MoveCache, children
+from doublecram.svg import streamGameTree
 from doublecram.mex import nim_addition
+from doublecram.store import ValueStore
+from doublecram.table import TranspositionTable
+from doublecram.tablefile import warm, save
+from doublecram.report import TextLog, JsonLog, Progress, Reporters
+from doublecram.instrument import Instruments
+from doublecram.checkpoint import Checkpointer, load as loadCheckpoint
+from grid import Shape
 from grid.shape import plot_text
 
+from collections import Counter
+import argparse
+import os
 import sys
 
-size = 5
+parser = argparse.ArgumentParser( description = "Solve doublecram on a square board." )
+parser.add_argument( "size", type = int, nargs = "?", default = 5 )
+parser.add_argument( "--db", help = "SQLite file of nim-values to reuse and extend" )
+parser.add_argument( "--memory", type = int, metavar = "MB",
+                     help = "keep at most about MB megabytes of nim-values" )
+parser.add_argument( "--warm", nargs = "+", default = [], metavar = "FILE",
+                     help = "nim-value tables or results/*.txt dumps to start from" )
+parser.add_argument( "--save", metavar = "FILE",
+                     help = "write the nim-values to this table when done" )
+parser.add_argument( "--workers", type = int, default = 1,
+                     help = "number of solver processes" )
+parser.add_argument( "--cache", type = int, default = 0, metavar = "N",
+                     help = "cache the moves of up to N shapes" )
+parser.add_argument( "--outcome", action = "store_true",
+                     help = "only find whether the first player wins" )
+parser.add_argument( "--verify-reduction", action = "store_true",
+                     help = "check the solver's shape reductions on this board "
+                            "instead of solving it" )
+parser.add_argument( "--tree", metavar = "FILE",
+                     help = "write the game tree to this SVG file" )
+parser.add_argument( "--tree-levels", type = int, default = 6 )
+parser.add_argument( "--tree-nodes", type = int, default = 40,
+                     help = "most positions to show on each level of the tree" )
+parser.add_argument( "--log", help = "write every solved position to this file" )
+parser.add_argument( "--log-format", choices = [ "text", "jsonl" ], default = "text" )
+parser.add_argument( "--progress", type = float, metavar = "SECONDS",
+                     help = "report progress this often" )
+parser.add_argument( "--profile", action = "store_true",
+                     help = "count and time the phases of the solver" )
+parser.add_argument( "--checkpoint", metavar = "FILE",
+                     help = "save the solver's progress to this file now and then" )
+parser.add_argument( "--checkpoint-interval", type = float, default = 600.0,
+                     metavar = "SECONDS",
+                     help = "least time between checkpoints" )
+parser.add_argument( "--resume", action = "store_true",
+                     help = "carry on from the --checkpoint file if there is one" )
+args = parser.parse_args()
+if args.db is not None and args.memory is not None:
+    parser.error( "--db and --memory cannot be combined" )
+if args.resume and args.checkpoint is None:
+    parser.error( "--resume needs --checkpoint" )
+if args.checkpoint is not None and ( args.workers > 1 or args.outcome ):
+    parser.error( "--checkpoint cannot be combined with --workers or --outcome" )
+if args.workers > 1 and not args.outcome and ( args.profile or args.cache > 0 ):
+    parser.error( "--profile and --cache cannot be combined with --workers" )
 
-if len(sys.argv) > 1:
-    size = int(sys.argv[1] )
-    
-square, square_val, values = solve_square( size )
+size = args.size
 
-print( "square has nim-value", square_val )
+if args.verify_reduction:
+    square = Shape( [(x,y) for x in range(size) for y in range(size)] ).canonical()
+    wrong, plainSize, reducedSize = verify_reduction( square )
+    print( "checked", plainSize, "positions,", len( wrong ), "differ;",
+           reducedSize, "positions solved with reductions" )
+    sys.exit( 1 if len( wrong ) > 0 else 0 )
 
-if square_val == 0:
-    print( "first player loss" )
+cache = None
+stats = Counter()
+profile = None
+if args.profile:
+    profile = stats = Instruments()
+if args.cache > 0:
+    cache = MoveCache( args.cache )
+if args.db is not None:
+    values = ValueStore( args.db )
+elif args.memory is not None:
+    values = TranspositionTable( args.memory << 20 )
 else:
-    vm = validMoves(square.coords)
+    values = {}
+
+checkpoint = None
+resume = None
+if args.checkpoint is not None:
+    info = { "board" : "square", "size" : size }
+    if args.resume and os.path.exists( args.checkpoint ):
+        saved = loadCheckpoint( args.checkpoint )
+        if saved["info"] != info:
+            parser.error( "{} is a checkpoint of another board".format( args.checkpoint ) )
+        if saved["values"] is not None:
+            values = saved["values"]
+        elif args.db is None:
+            parser.error( "{} keeps its values in a --db file".format( args.checkpoint ) )
+        info = saved["info"]
+        resume = saved["solver"]
+        print( "resuming from", args.checkpoint )
+    elif args.resume:
+        print( "no checkpoint in", args.checkpoint, "so starting afresh" )
+    checkpoint = Checkpointer( args.checkpoint, values, args.checkpoint_interval,
+                               info = info )
+if len( args.warm ) > 0:
+    values.update( warm( args.warm ) )
+
+log = None
+reporters = []
+if args.log is not None:
+    log = open( args.log, "w" )
+    reporters.append( JsonLog( log ) if args.log_format == "jsonl" else TextLog( log ) )
+if args.progress is not None:
+    reporters.append( Progress( values, args.progress, profile = profile ) )
+report = Reporters( *reporters ) if len( reporters ) > 0 else None
+
+try:
+    if args.outcome:
+        square = Shape( [(x,y) for x in range(size) for y in range(size)] ).canonical()
+        outcomes = {}
+        win = solve_outcome( square, values, outcomes, cache, stats, report )
+    else:
+        square, square_val, values = solve_square( size, values, args.workers,
+                                                   cache, stats, report,
+                                                   checkpoint, resume )
+        if checkpoint is not None:
+            checkpoint.write()
+        win = square_val != 0
+        print( "square has nim-value", square_val )
+finally:
+    if args.db is not None:
+        values.flush()
+    if report is not None:
+        report.flush()
+    if log is not None:
+        log.close()
+
+if args.save is not None:
+    save( dict( values.items() ), args.save )
 
-    for move in vm:
-        partition = makeMove(square, move )
-        if len( partition ) == 0:
+if not win:
+    print( "first player loss" )
+elif args.outcome:
+    print( "first player win" )
+    for move, keys in children( square, cache ):
+        if is_loss( keys, values, outcomes, cache, stats ):
+            print( "winning move is", move, "to:" )
+            plot_text( [ Shape.fromKey( k ) for k in keys ] )
+            break
+else:
+    for move, keys in children( square, cache ):
+        if len( keys ) == 0:
             print( "optimal move is", move )
             break
 
-        sub_positions = [ values[s.key()] for s in partition ]
+        sub_positions = [ solve_position( Shape.fromKey( k ), values, cache )
+                          for k in keys ]
         total = nim_addition( *sub_positions )
         if total == 0:
             print( "optimal move is", move, "to:" )
-            plot_text( partition )
+            plot_text( [ Shape.fromKey( k ) for k in keys ] )
             break
+
+if args.tree is not None:
+    with open( args.tree, "w" ) as f:
+        streamGameTree( square, values, f, args.tree_levels, args.tree_nodes,
+                        cache = cache )
+    if args.db is not None:
+        values.flush()
+
+print( "skipped", stats["skipped"], "subtrees" )
+if cache is not None:
+    print( "move cache:", cache.stats() )
+if args.memory is not None:
+    print( "values:", values.stats() )
+if profile is not None:
+    print( profile.summary() )
+    print( "partition sums:", SUMS.stats() )
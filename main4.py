@@ -1,22 +1,122 @@
-from doublecram.solve import solve_mn
-from doublecram.svg import gameTree
-from grid import Shape
+from doublecram.solve import solve_strips, SUMS
+from doublecram.store import ValueStore
+from doublecram.table import TranspositionTable
+from doublecram.tablefile import warm, save
+from doublecram.report import TextLog, JsonLog, Progress, Reporters
+from doublecram.instrument import Instruments
+from doublecram.checkpoint import Checkpointer, load as loadCheckpoint
 
+import argparse
+import os
 import sys
 
-height = 4
-size = 20
-
-if len(sys.argv) > 1:
-    size = int(sys.argv[1] )
-    
-rect, rect_val, values = solve_mn( height, size )
-#d = gameTree( rect, values )
-#d.saveas( "game-tree-{}x{}.svg".format( height, size ) )
-
-for i in range(2,size+1):
-    coords = [(x,y) for x in range(i) for y in range(height)]
-    rect = Shape( coords ).canonical()
-    key = rect.key()
-    if key in values:
-        print( "{:2d}x{:2d} = {}".format( i, height, values[key] ))
+parser = argparse.ArgumentParser( description = "Solve doublecram on 4xN boards, widest last." )
+parser.add_argument( "size", type = int, nargs = "?", default = 20,
+                     help = "widest board to solve, or 0 to keep going" )
+parser.add_argument( "--height", type = int, default = 4 )
+parser.add_argument( "--max-cells", type = int, metavar = "N",
+                     help = "between widths, forget positions with more "
+                            "than N squares" )
+parser.add_argument( "--db", help = "SQLite file of nim-values to reuse and extend" )
+parser.add_argument( "--memory", type = int, metavar = "MB",
+                     help = "keep at most about MB megabytes of nim-values" )
+parser.add_argument( "--warm", nargs = "+", default = [], metavar = "FILE",
+                     help = "nim-value tables or results/*.txt dumps to start from" )
+parser.add_argument( "--save", metavar = "FILE",
+                     help = "write the nim-values to this table when done" )
+parser.add_argument( "--workers", type = int, default = 1,
+                     help = "number of solver processes" )
+parser.add_argument( "--log", help = "write every solved position to this file" )
+parser.add_argument( "--log-format", choices = [ "text", "jsonl" ], default = "text" )
+parser.add_argument( "--progress", type = float, metavar = "SECONDS",
+                     help = "report progress this often" )
+parser.add_argument( "--profile", action = "store_true",
+                     help = "count and time the phases of the solver" )
+parser.add_argument( "--checkpoint", metavar = "FILE",
+                     help = "save the solver's progress to this file now and then" )
+parser.add_argument( "--checkpoint-interval", type = float, default = 600.0,
+                     metavar = "SECONDS",
+                     help = "least time between checkpoints" )
+parser.add_argument( "--resume", action = "store_true",
+                     help = "carry on from the --checkpoint file if there is one" )
+args = parser.parse_args()
+if args.db is not None and args.memory is not None:
+    parser.error( "--db and --memory cannot be combined" )
+if args.resume and args.checkpoint is None:
+    parser.error( "--resume needs --checkpoint" )
+if args.checkpoint is not None and args.workers > 1:
+    parser.error( "--checkpoint cannot be combined with --workers" )
+if args.profile and args.workers > 1:
+    parser.error( "--profile cannot be combined with --workers" )
+
+height = args.height
+size = args.size if args.size > 0 else None
+
+if args.db is not None:
+    values = ValueStore( args.db )
+elif args.memory is not None:
+    values = TranspositionTable( args.memory << 20 )
+else:
+    values = {}
+
+checkpoint = None
+resume = None
+if args.checkpoint is not None:
+    info = { "board" : "strips", "height" : height, "width" : 2 }
+    if args.resume and os.path.exists( args.checkpoint ):
+        saved = loadCheckpoint( args.checkpoint )
+        if any( saved["info"].get( k ) != v for k, v in info.items() if k != "width" ):
+            parser.error( "{} is a checkpoint of another board".format( args.checkpoint ) )
+        if saved["values"] is not None:
+            values = saved["values"]
+        elif args.db is None:
+            parser.error( "{} keeps its values in a --db file".format( args.checkpoint ) )
+        info = saved["info"]
+        resume = saved["solver"]
+        print( "resuming from", args.checkpoint )
+    elif args.resume:
+        print( "no checkpoint in", args.checkpoint, "so starting afresh" )
+    checkpoint = Checkpointer( args.checkpoint, values, args.checkpoint_interval,
+                               info = info )
+if len( args.warm ) > 0:
+    values.update( warm( args.warm ) )
+
+profile = None
+if args.profile:
+    profile = Instruments()
+
+log = None
+reporters = []
+if args.log is not None:
+    log = open( args.log, "w" )
+    reporters.append( JsonLog( log ) if args.log_format == "jsonl" else TextLog( log ) )
+if args.progress is not None:
+    reporters.append( Progress( values, args.progress, profile = profile ) )
+report = Reporters( *reporters ) if len( reporters ) > 0 else None
+
+start = 2 if checkpoint is None else checkpoint.info["width"]
+try:
+    for i, val in solve_strips( height, size, values, args.workers,
+                                stats = profile, report = report,
+                                max_cells = args.max_cells, start = start,
+                                checkpoint = checkpoint, resume = resume ):
+        print( "{:2d}x{:2d} = {}".format( i, height, val ) )
+        sys.stdout.flush()
+        if checkpoint is not None:
+            checkpoint.info["width"] = i + 1
+            checkpoint.write()
+finally:
+    if args.db is not None:
+        values.flush()
+    if report is not None:
+        report.flush()
+    if log is not None:
+        log.close()
+
+if args.save is not None:
+    save( dict( values.items() ), args.save )
+if args.memory is not None:
+    print( "values:", values.stats() )
+if profile is not None:
+    print( profile.summary() )
+    print( "partition sums:", SUMS.stats() )